@@ -1,9 +1,19 @@
 import numpy as np
 import gensim
 import csv
+import os
+import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'word_embedding'))
+from embedding_io import load_embeddings
+
+
+# a text embedding can be converted once with word_embedding/embedding_io.py
 embed_path = '/Users/howard50b/Documents/machine-learning/code/word-embedding/glove_6B_100d.txt'
-model = gensim.models.Word2Vec.load_word2vec_format(embed_path, binary=False)
+if embed_path.endswith('.npy'):
+    model = load_embeddings(embed_path) # memory-mapped, supports `word in model` and `model[word]`
+else:
+    model = gensim.models.Word2Vec.load_word2vec_format(embed_path, binary=False)
 embed_size = len(model['the'])
 print('Done loading embedding model.')
 
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+import time
+from argparse import ArgumentParser
+from hmm_loader import Loader
+from hmm import HMM
+
+
+def timed_accuracy(hmm, dev_x, dev_y, decode, k=None):
+    '''
+    Decode dev set once and return (accuracy, seconds used).
+    '''
+    start = time.time()
+    acc = hmm.accuracy(dev_x, dev_y, decode=decode, k=k)
+    return acc, time.time() - start
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--ngram', dest='ngram', type=int, default=3,
+                        help='order of the HMM, e.g. 2 for bigram, 3 for trigram')
+    parser.add_argument('-k', '--max_k', dest='max_k', type=int, default=20,
+                        help='largest beam size to benchmark')
+    args = parser.parse_args()
+
+    loader = Loader(ngram=args.ngram)
+    train_x, train_y = loader.load_data('train')
+    dev_x, dev_y = loader.load_data('dev')
+    print('Done loading data.')
+
+    hmm = HMM(tag_vocab=loader.tag_vocab, ngram=args.ngram)
+    hmm.train(train_x, train_y, smooth='add_one')
+    print('Done training.')
+
+    num_tokens = sum(len(sentence) for sentence in dev_x)
+    acc, secs = timed_accuracy(hmm, dev_x, dev_y, 'viterbi')
+    print('{:>8} {:>10} {:>10} {:>12}'.format('decode', 'accuracy', 'time (s)', 'tokens/s'))
+    print('{:>8} {:>10.4f} {:>10.2f} {:>12.0f}'.format('viterbi', acc, secs, num_tokens / secs))
+    for k in range(1, args.max_k + 1):
+        acc, secs = timed_accuracy(hmm, dev_x, dev_y, 'beam', k=k)
+        print('{:>8} {:>10.4f} {:>10.2f} {:>12.0f}'.format('k=%d' % k, acc, secs, num_tokens / secs))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import numpy as np
+import contextlib
+import io
+import os
+import resource
+import time
+from argparse import ArgumentParser
+from hmm import HMM
+from hmm_loader import Loader
+
+
+def make_corpus(path, num_tokens, num_tags=40, vocab_size=20000, seed=0):
+    '''
+    Write a synthetic corpus in the format of ./data: {train,dev}_{x,y}.csv and test_x.csv.
+    Tags follow a random sparse transition matrix and words a Zipf-like distribution
+    per tag, so the corpus has ambiguous, rare and unseen words like real text.
+    Args:
+        path: str, output directory
+        num_tokens: int, number of training tokens, dev and test get a fifth of it each
+        num_tags: int, number of tags besides '.'
+        vocab_size: int, number of distinct words
+        seed: int, random seed
+    '''
+    rng = np.random.RandomState(seed)
+    os.makedirs(path, exist_ok=True)
+    # each tag is followed by one of a few tags, '.' (index num_tags) ends a sentence
+    transitions = rng.dirichlet(np.full(num_tags + 1, 0.1), size=num_tags + 1)
+    transitions[:, num_tags] += 0.05
+    transitions /= transitions.sum(axis=1, keepdims=True)
+    cum_transitions = transitions.cumsum(axis=1)
+    # each tag emits a random subset of the vocabulary with Zipf-like weights
+    tag_words = [rng.choice(vocab_size, size=rng.randint(5, vocab_size // 10 + 6)) for _ in range(num_tags)]
+    cum_weights = [np.cumsum(1 / np.arange(1, len(words) + 1)) for words in tag_words]
+
+    def write(mode, n):
+        tags = np.zeros(n, dtype=np.int64)
+        draws = rng.rand(n)
+        prev = num_tags
+        for i in range(n):
+            prev = tags[i] = min(np.searchsorted(cum_transitions[prev], draws[i]), num_tags)
+        tags[-1] = num_tags
+        words = []
+        for tag, draw in zip(tags, rng.rand(n)):
+            if tag == num_tags:
+                words.append('.')
+            else:
+                weights = cum_weights[tag]
+                index = min(np.searchsorted(weights, draw * weights[-1]), len(weights) - 1)
+                words.append('w%d' % tag_words[tag][index])
+        tag_names = ['T%d' % tag if tag < num_tags else '.' for tag in tags]
+        with open(os.path.join(path, mode + '_x.csv'), 'w') as f:
+            f.write('id,word\n')
+            f.writelines('{},"{}"\n'.format(i, word) for i, word in enumerate(words))
+        if mode != 'test':
+            with open(os.path.join(path, mode + '_y.csv'), 'w') as f:
+                f.write('id,tag\n')
+                f.writelines('{},"{}"\n'.format(i, tag) for i, tag in enumerate(tag_names))
+
+    write('train', num_tokens)
+    write('dev', max(num_tokens // 5, 1))
+    write('test', max(num_tokens // 5, 1))
+
+
+def peak_rss_mb():
+    '''
+    Peak resident set size of this process so far, in MB (ru_maxrss is in KB on Linux).
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Benchmark:
+    def __init__(self):
+        self.rows = []
+
+    def run(self, phase, num_tokens, fn, *args, **kwargs):
+        '''
+        Time fn(*args, **kwargs) and record wall time, tokens/sec and peak RSS after it.
+        Output printed by fn is discarded. Returns what fn returns.
+        Args:
+            phase: str, name of the phase
+            num_tokens: int, or a function computing it from the result of fn
+            fn: callable, the phase to run
+        '''
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn(*args, **kwargs)
+        secs = time.time() - start
+        if callable(num_tokens):
+            num_tokens = num_tokens(result)
+        self.rows.append((phase, secs, num_tokens, num_tokens / secs if secs > 0 else float('inf'), peak_rss_mb()))
+        return result
+
+    def report(self):
+        print('{:<20} {:>10} {:>10} {:>12} {:>14}'.format('phase', 'time (s)', 'tokens', 'tokens/s', 'peak RSS (MB)'))
+        for phase, secs, num_tokens, speed, rss in self.rows:
+            print('{:<20} {:>10.3f} {:>10d} {:>12.0f} {:>14.1f}'.format(phase, secs, num_tokens, speed, rss))
+
+
+def count_tokens(x):
+    return sum(1 for sentence in x for word in sentence if word != '*' and word != '<STOP>')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--ngram', dest='ngram', type=int, default=3,
+                        help='order of the HMM')
+    parser.add_argument('-t', '--tokens', dest='tokens', type=int, default=0,
+                        help='size of a synthetic training corpus, 0 to use ./data')
+    parser.add_argument('--tags', dest='tags', type=int, default=40,
+                        help='number of tags of the synthetic corpus')
+    parser.add_argument('--data_dir', dest='data_dir', default='./bench_data',
+                        help='where the synthetic corpus is written')
+    parser.add_argument('--seed', dest='seed', type=int, default=0,
+                        help='random seed of the synthetic corpus')
+    parser.add_argument('-k', dest='k', default='1,3,10',
+                        help='comma separated beam sizes')
+    parser.add_argument('-s', '--smooth', dest='smooth', default='add_one',
+                        help="'add_one' or 'linear_interpolate'")
+    args = parser.parse_args()
+
+    loader = Loader(ngram=args.ngram)
+    if args.tokens > 0:
+        make_corpus(args.data_dir, args.tokens, num_tags=args.tags, seed=args.seed)
+        loader.data_path = os.path.join(args.data_dir, '{}_x.csv')
+        loader.label_path = os.path.join(args.data_dir, '{}_y.csv')
+
+    bench = Benchmark()
+    train_x, train_y = bench.run('load train', lambda data: count_tokens(data[0]), loader.load_data, 'train')
+    dev_x, dev_y = bench.run('load dev', lambda data: count_tokens(data[0]), loader.load_data, 'dev')
+    num_train, num_dev = count_tokens(train_x), count_tokens(dev_x)
+
+    hmm = HMM(tag_vocab=loader.tag_vocab, ngram=args.ngram)
+    lambdas = tuple(np.full(args.ngram, 1 / args.ngram))
+    bench.run('train', num_train, hmm.train, train_x, train_y, smooth=args.smooth, lambdas=lambdas)
+    bench.run('viterbi', num_dev, hmm.inference, dev_x, decode='viterbi')
+    for k in [int(k) for k in args.k.split(',')]:
+        bench.run('beam k=%d' % k, num_dev, hmm.inference, dev_x, decode='beam', k=k)
+    bench.run('suboptimal viterbi', num_dev, hmm.find_suboptimal_sequences, dev_x, dev_y, decode='viterbi')
+    bench.report()
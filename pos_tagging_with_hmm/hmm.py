@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+import numpy as np
+import multiprocessing
+import itertools
+import json
+import os
+from argparse import ArgumentParser
+from hmm_loader import Loader
+
+
+# trained model inherited by forked decoding workers, see HMM._parallel_inference
+_worker_hmm = None
+
+
+def _decode_chunk(args):
+    x, decode, k = args
+    return _worker_hmm.inference(x, decode, k)
+
+
+class HMM:
+    def __init__(self, tag_vocab, ngram=3):
+        '''
+        Args:
+            tag_vocab: iterable of str, all tags including '*' and '<STOP>'
+            ngram: int, order of the model, i.e. a tag depends on the ngram - 1 previous tags
+        '''
+        if ngram < 2:
+            raise ValueError('HMM needs ngram >= 2.')
+        self.ngram = ngram
+        self.tag_list = list(tag_vocab)
+        self.tag_ids = {tag: i for i, tag in enumerate(self.tag_list)}
+        self.word_ids = None
+        self.emission_table = None
+        self.tag_dict_tags = None
+        self.tag_dict_offsets = None
+
+        # Transition log probabilities are stored as one row of P(N | context) per
+        # observed context. Contexts (V1, ..., Vm) list previous tags from the nearest
+        # one and are encoded in base #tags with V1 as the most significant digit.
+        # context_keys[m] holds the sorted codes of observed contexts of length m,
+        # whose rows start at row_offsets[m] in transition_rows. Level 0 is a single
+        # row used when no context of any length is observed.
+        self.transition_rows = None
+        self.context_keys = None
+        self.row_offsets = None
+
+        # Raw counts kept for partial_fit: emission_count[word, tag] (rows beyond
+        # len(word_ids) are spare capacity) and, for every context length m,
+        # context_counts[m] = (sorted context codes, counts of (context, N)).
+        self.smooth = None
+        self.lambdas = None
+        self.emission_count = None
+        self.context_counts = None
+        # tags and longest contexts counted since the tables were last refreshed
+        self._stale_tags = []
+        self._stale_contexts = []
+
+    def train(self, train_x, train_y, smooth, lambdas=None):
+        '''
+        Train HMM with ML estimations.
+        Store results in self.emission_table and self.transition_rows.
+        Args:
+            train_x: List[List[str]], observations
+            train_y: List[List[str]], tags
+            smooth: str, smoothing method for transition estimations
+                    'add_one' or 'linear_interpolate'
+            lambdas: tuple, interpolation weights from unigram to ngram estimations
+        '''
+        self.train_stream(zip(train_x, train_y), smooth, lambdas)
+
+    def train_stream(self, pairs, smooth, lambdas=None, chunk_size=10000):
+        '''
+        Train HMM from a stream of (sentence, tags) pairs, e.g. Loader.stream_data('train').
+        Counts are accumulated chunk by chunk, so memory depends on the vocabulary
+        size, the number of observed ngrams and chunk_size instead of the corpus size.
+        Args:
+            pairs: iterable of (List[str], List[str]), observations and tags
+            smooth: str, 'add_one' or 'linear_interpolate'
+            lambdas: tuple, interpolation weights for linear_interpolate
+            chunk_size: int, number of sentences counted at a time
+        '''
+        if smooth == 'linear_interpolate':
+            assert lambdas is not None and len(lambdas) == self.ngram
+        elif smooth != 'add_one':
+            raise NotImplementedError('Smoothing method not implemented.')
+        num_tags = len(self.tag_list)
+        self.smooth = smooth
+        self.lambdas = lambdas
+        self.word_ids = {}
+        self.emission_count = np.zeros((0, num_tags), dtype=np.int64)
+        self.context_counts = [(np.zeros(0, dtype=np.int64), np.zeros((0, num_tags), dtype=np.int64))
+                               for _ in range(self.ngram)]
+        self._count(pairs, chunk_size)
+        self._stale_tags = []
+        self._stale_contexts = []
+        self.emission_table = self._emisson_probs(self.emission_count[:len(self.word_ids)])
+        self.tag_dict_tags, self.tag_dict_offsets = self._build_tag_dict(self.emission_table)
+        self._transition_probs()
+
+    def partial_fit(self, new_x, new_y, chunk_size=10000):
+        '''
+        Add newly annotated sentences to a trained model without retraining from scratch.
+        Only the raw counts are updated here. Probabilities are recomputed lazily before
+        the next decoding or save, and only for the emission columns of tags and the
+        transition rows of contexts seen in the new data (linear_interpolate recomputes
+        all transition rows from counts since its unigram term changes every row).
+        Args:
+            new_x: List[List[str]], observations, bucketed with the loader used for training
+            new_y: List[List[str]], tags, all in tag_vocab
+            chunk_size: int, number of sentences counted at a time
+        '''
+        if self.emission_count is None:
+            raise ValueError('HMM has no counts to update, train it first.')
+        # counts of a loaded model may be read-only memory maps
+        if not self.emission_count.flags.writeable:
+            self.emission_count = np.array(self.emission_count)
+        self.context_counts = [(keys, counts if counts.flags.writeable else np.array(counts))
+                               for keys, counts in self.context_counts]
+        self._count(zip(new_x, new_y), chunk_size)
+
+    def save(self, path):
+        '''
+        Save the trained model to directory path: a JSON header with the tag and
+        word vocabularies plus one .npy file per table, which load() memory-maps.
+        Raw counts are saved as well so a loaded model can be updated by partial_fit.
+        '''
+        self._refresh()
+        os.makedirs(path, exist_ok=True)
+        words = [None] * len(self.word_ids)
+        for word, i in self.word_ids.items():
+            words[i] = word
+        count_offsets = np.cumsum([0] + [len(keys) for keys, _ in self.context_counts[:-1]])
+        with open(os.path.join(path, 'model.json'), 'w') as f:
+            json.dump({'ngram': self.ngram,
+                       'tags': self.tag_list,
+                       'words': words,
+                       'row_offsets': [int(offset) for offset in self.row_offsets],
+                       'smooth': self.smooth,
+                       'lambdas': None if self.lambdas is None else list(self.lambdas),
+                       'count_offsets': [int(offset) for offset in count_offsets]}, f)
+        np.save(os.path.join(path, 'emission_table.npy'), self.emission_table)
+        np.save(os.path.join(path, 'transition_rows.npy'), self.transition_rows)
+        np.save(os.path.join(path, 'context_keys.npy'), np.concatenate(self.context_keys))
+        np.save(os.path.join(path, 'tag_dict_tags.npy'), self.tag_dict_tags)
+        np.save(os.path.join(path, 'tag_dict_offsets.npy'), self.tag_dict_offsets)
+        np.save(os.path.join(path, 'emission_count.npy'), self.emission_count[:len(words)])
+        np.save(os.path.join(path, 'context_count_keys.npy'), np.concatenate([keys for keys, _ in self.context_counts]))
+        np.save(os.path.join(path, 'context_counts.npy'), np.vstack([counts for _, counts in self.context_counts]))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        '''
+        Load a model written by save(). Tables are memory-mapped read-only by default,
+        so processes loading the same model share one copy through the page cache.
+        Args:
+            path: str, directory written by save()
+            mmap_mode: str or None, passed to np.load, None reads tables into memory
+        Returns:
+            hmm: HMM, model ready for inference
+        '''
+        with open(os.path.join(path, 'model.json')) as f:
+            header = json.load(f)
+        hmm = cls(tag_vocab=header['tags'], ngram=header['ngram'])
+        hmm.word_ids = {word: i for i, word in enumerate(header['words'])}
+        hmm.emission_table = np.load(os.path.join(path, 'emission_table.npy'), mmap_mode=mmap_mode)
+        hmm.transition_rows = np.load(os.path.join(path, 'transition_rows.npy'), mmap_mode=mmap_mode)
+        hmm.row_offsets = header['row_offsets']
+        context_keys = np.load(os.path.join(path, 'context_keys.npy'), mmap_mode=mmap_mode)
+        hmm.context_keys = np.split(context_keys, hmm.row_offsets[1:])
+        hmm.tag_dict_tags = np.load(os.path.join(path, 'tag_dict_tags.npy'), mmap_mode=mmap_mode)
+        hmm.tag_dict_offsets = np.load(os.path.join(path, 'tag_dict_offsets.npy'), mmap_mode=mmap_mode)
+        hmm.smooth = header['smooth']
+        hmm.lambdas = None if header['lambdas'] is None else tuple(header['lambdas'])
+        hmm.emission_count = np.load(os.path.join(path, 'emission_count.npy'), mmap_mode=mmap_mode)
+        count_keys = np.load(os.path.join(path, 'context_count_keys.npy'), mmap_mode=mmap_mode)
+        counts = np.load(os.path.join(path, 'context_counts.npy'), mmap_mode=mmap_mode)
+        hmm.context_counts = list(zip(np.split(count_keys, header['count_offsets'][1:]),
+                                      np.split(counts, header['count_offsets'][1:])))
+        return hmm
+
+    def _count(self, pairs, chunk_size):
+        '''
+        Add counts of (sentence, tags) pairs to emission_count and context_counts
+        chunk by chunk, and remember which tags and contexts were touched.
+        '''
+        pairs = iter(pairs)
+        chunk = list(itertools.islice(pairs, chunk_size))
+        while chunk:
+            words, tags, positions = self._encode(chunk)
+            self._count_emissions(words, tags[positions])
+            contexts = self._count_transitions(tags, positions)
+            self._stale_tags.append(np.unique(tags[positions]))
+            self._stale_contexts.append(np.unique(contexts))
+            chunk = list(itertools.islice(pairs, chunk_size))
+
+    def _encode(self, pairs):
+        '''
+        Intern words and tags to integer ids. Unseen words get new ids.
+        Args:
+            pairs: List[(List[str], List[str])], observations and tags
+        Returns:
+            words: ndarray with shape (#non-padding tokens,), word ids
+            tags: ndarray with shape (#tokens,), tag ids of all tokens, paddings included
+            positions: ndarray with shape (#non-padding tokens,), indices of non-padding tokens in tags
+        Store:
+            word_ids: dict, mapping from words to rows of emission_table
+        '''
+        tag_ids = self.tag_ids
+        word_ids = self.word_ids
+        tags = np.array([tag_ids[tag] for _, tags in pairs for tag in tags], dtype=np.int64)
+        positions = np.flatnonzero(tags != tag_ids['*'])
+        words = [word for sentence, _ in pairs for word in sentence]
+        words = np.array([word_ids.setdefault(words[i], len(word_ids)) for i in positions], dtype=np.int64)
+        return words, tags, positions
+
+    def _count_emissions(self, words, tags):
+        '''
+        Add (word, tag) counts to emission_count, growing its rows geometrically
+        when new words have been interned.
+        '''
+        num_words = len(self.word_ids)
+        emission_count = self.emission_count
+        if num_words > len(emission_count):
+            grown = np.zeros((max(num_words, 2 * len(emission_count)), emission_count.shape[1]), dtype=np.int64)
+            grown[:len(emission_count)] = emission_count
+            self.emission_count = emission_count = grown
+        np.add.at(emission_count, (words, tags), 1)
+
+    def _count_transitions(self, tags, positions):
+        '''
+        Add counts of (context, N) for the tags N at the non-padding positions and
+        every context length. Only observed contexts are stored.
+        Returns:
+            contexts: ndarray, codes of the longest contexts (V1, ..., Vn-1) of the positions
+        '''
+        num_tags = len(self.tag_list)
+        next_tags = tags[positions]
+        contexts = np.zeros(len(positions), dtype=np.int64)
+        for j in range(1, self.ngram):
+            contexts = contexts * num_tags + tags[positions - j]
+        for m in range(self.ngram):
+            keys, counts = self.context_counts[m]
+            level_contexts = contexts // num_tags ** (self.ngram - 1 - m)
+            new_keys = np.setdiff1d(level_contexts, keys)
+            if len(new_keys) > 0:
+                merged_keys = np.union1d(keys, new_keys)
+                merged_counts = np.zeros((len(merged_keys), num_tags), dtype=np.int64)
+                merged_counts[np.searchsorted(merged_keys, keys)] = counts
+                keys, counts = merged_keys, merged_counts
+            np.add.at(counts, (np.searchsorted(keys, level_contexts), next_tags), 1)
+            self.context_counts[m] = (keys, counts)
+        return contexts
+
+    def _refresh(self):
+        '''
+        Recompute probabilities touched by partial_fit since the last refresh.
+        '''
+        if not self._stale_tags:
+            return
+        tags = np.unique(np.concatenate(self._stale_tags))
+        contexts = np.unique(np.concatenate(self._stale_contexts))
+        self._stale_tags = []
+        self._stale_contexts = []
+
+        # emissions: new words get rows, P(word | tag) changes only in columns of counted tags
+        num_tags = len(self.tag_list)
+        num_new = len(self.word_ids) - len(self.emission_table)
+        emissions = np.vstack([self.emission_table, np.full((num_new, num_tags), float('-inf'))])
+        emissions[:, tags] = self._emisson_probs(self.emission_count[:len(self.word_ids), tags])
+        self.emission_table = emissions
+        self.tag_dict_tags, self.tag_dict_offsets = self._build_tag_dict(emissions)
+
+        if self.smooth == 'linear_interpolate':
+            self._transition_probs()
+            return
+        # add_one: only rows of contexts counted again change, new contexts get rows
+        offset = self.row_offsets[-1]
+        keys, counts = self.context_counts[-1]
+        rows = np.zeros((len(keys), num_tags))
+        rows[np.searchsorted(keys, self.context_keys[-1])] = self.transition_rows[offset:]
+        changed = np.searchsorted(keys, contexts)
+        rows[changed] = self._add_one_rows(counts[changed])
+        self.context_keys[-1] = keys
+        self.transition_rows = np.vstack([self.transition_rows[:offset], rows])
+
+    def _build_tag_dict(self, emissions):
+        '''
+        Collect the tags observed with each word, i.e. tags with a finite emission probability.
+        Decoders only expand these tags since all other tags have zero probability.
+        Args:
+            emissions: ndarray with shape (#words, #tags), log P(word | tag)
+        Returns:
+            tag_dict_tags: ndarray, allowed tag ids of all words, concatenated in word id order
+            tag_dict_offsets: ndarray with shape (#words + 1,), allowed tags of word i are
+                              tag_dict_tags[tag_dict_offsets[i]:tag_dict_offsets[i + 1]]
+        '''
+        rows, tags = np.nonzero(np.isfinite(emissions))
+        return tags, np.searchsorted(rows, np.arange(len(emissions) + 1))
+
+    def _word_row(self, word):
+        '''
+        Return the row of a word in emission_table. Words never seen in training
+        fall back to the '<UNK>' bucket, None is returned if there is no such bucket.
+        '''
+        if word in self.word_ids:
+            return self.word_ids[word]
+        return self.word_ids.get('<UNK>')
+
+    def _allowed_tags(self, word):
+        '''
+        Return allowed tag ids of a word and log P(word | tag) of these tags.
+        '''
+        row = self._word_row(word)
+        if row is None:
+            return np.arange(len(self.tag_list)), np.full(len(self.tag_list), float('-inf'))
+        tags = self.tag_dict_tags[self.tag_dict_offsets[row]:self.tag_dict_offsets[row + 1]]
+        return tags, self.emission_table[row, tags]
+
+    def _emission_column(self, word):
+        '''
+        Return log P(word | tag) for all tags.
+        '''
+        row = self._word_row(word)
+        if row is None:
+            return np.full(len(self.tag_list), float('-inf'))
+        return self.emission_table[row]
+
+    def _emisson_probs(self, emission_count):
+        '''
+        Calculate ML estimations to construct emission probability table.
+        Args:
+            emission_count: ndarray with shape (#words, #tags), count of (word, tag) pairs
+        Returns:
+            emissions: ndarray with shape (#words, #tags), emission probabilities, i.e. log P(word | tag)
+        '''
+        tag_count = emission_count.sum(axis=0)
+        # missing P(word | tag) will be viewed as -inf in log space
+        with np.errstate(divide='ignore', invalid='ignore'):
+            emissions = np.where(emission_count > 0, np.log(emission_count / tag_count), float('-inf'))
+        return emissions
+
+    def _transition_probs(self):
+        '''
+        Build either add_one or linear_interpolate smoothed transition probabilities
+        from context_counts, with the smoothing method and lambdas given to train.
+        Store:
+            transition_rows, context_keys, row_offsets, see __init__
+        '''
+        if self.smooth == 'add_one':
+            levels = self._transition_add_one()
+        else:
+            levels = self._transition_linear_interpolate(self.lambdas)
+        self.context_keys = [contexts for contexts, _ in levels]
+        self.row_offsets = [0]
+        for contexts in self.context_keys[:-1]:
+            self.row_offsets.append(self.row_offsets[-1] + len(contexts))
+        self.transition_rows = np.vstack([rows for _, rows in levels])
+
+    def _transition_linear_interpolate(self, lambdas):
+        '''
+        P(N | V1, ..., Vn-1) = sum_m lambdas[m] * P_ML(N | V1, ..., Vm), where the
+        estimation of an unobserved context is 0. Rows are kept for observed contexts
+        of every length: an unobserved context backs off to its longest observed
+        prefix, which has exactly the interpolated probabilities of the full context.
+        Returns:
+            levels: List[(ndarray, ndarray)], sorted context codes and log probability
+                    rows for context lengths 0 to n - 1
+        '''
+        num_tags = len(self.tag_list)
+        contexts, counts = self.context_counts[0]
+        probs = lambdas[0] * counts / counts.sum()
+        levels = [(contexts, probs)]
+        for m in range(1, self.ngram):
+            contexts, counts = self.context_counts[m]
+            prefixes = np.searchsorted(levels[-1][0], contexts // num_tags)
+            probs = lambdas[m] * counts / counts.sum(axis=1, keepdims=True) + levels[-1][1][prefixes]
+            levels.append((contexts, probs))
+        with np.errstate(divide='ignore'):
+            return [(contexts, np.log(probs)) for contexts, probs in levels]
+
+    def _transition_add_one(self):
+        '''
+        P(N | V1, ..., Vn-1) = (count(N, V1, ..., Vn-1) + 1) / (count(V1, ..., Vn-1) + #contexts),
+        every possible context gets one pseudo count. All unobserved contexts share
+        the level 0 row, no rows are kept for shorter contexts.
+        Returns:
+            levels: List[(ndarray, ndarray)], sorted context codes and log probability
+                    rows for context lengths 0 to n - 1
+        '''
+        num_tags = len(self.tag_list)
+        contexts, counts = self.context_counts[-1]
+        unseen = self._add_one_rows(np.zeros((1, num_tags)))
+        empty = (np.zeros(0, dtype=np.int64), np.zeros((0, num_tags)))
+        return ([(np.zeros(1, dtype=np.int64), unseen)] + [empty] * (self.ngram - 2)
+                + [(contexts, self._add_one_rows(counts))])
+
+    def _add_one_rows(self, counts):
+        '''
+        Return add_one smoothed log P(N | context) for rows of (context, N) counts.
+        '''
+        num_contexts = len(self.tag_list) ** (self.ngram - 1)
+        return np.log((counts + 1) / (counts.sum(axis=1, keepdims=True) + num_contexts))
+
+    def _context_rows(self, contexts):
+        '''
+        Find the transition row of each context, backing off to shorter contexts
+        when a context was never observed.
+        Args:
+            contexts: List[ndarray], previous tags V1, ..., Vn-1 (nearest first), one array each
+        Returns:
+            rows: ndarray, row indices into transition_rows
+        '''
+        num_tags = len(self.tag_list)
+        rows = np.zeros(len(contexts[0]), dtype=np.int64)
+        found = np.zeros(len(contexts[0]), dtype=bool)
+        codes = [contexts[0]]
+        for V in contexts[1:]:
+            codes.append(codes[-1] * num_tags + V)
+        for m in range(self.ngram - 1, 0, -1):
+            keys = self.context_keys[m]
+            if len(keys) == 0:
+                continue
+            positions = np.minimum(np.searchsorted(keys, codes[m - 1]), len(keys) - 1)
+            match = ~found & (keys[positions] == codes[m - 1])
+            rows[match] = self.row_offsets[m] + positions[match]
+            found |= match
+            if found.all():
+                break
+        return rows
+
+    def _transition_block(self, tags, contexts):
+        '''
+        Return log P(N | V1, ..., Vn-1) for N in tags and every combination of previous tags.
+        Args:
+            tags: ndarray, candidate tag ids N
+            contexts: List[ndarray], candidate tag ids of V1, ..., Vn-1
+        Returns:
+            block: ndarray with shape (len(tags), len(contexts[0]), ..., len(contexts[-1]))
+        '''
+        grid = np.meshgrid(*contexts, indexing='ij')
+        rows = self._context_rows([V.ravel() for V in grid])
+        block = self.transition_rows[rows[:, np.newaxis], tags[np.newaxis, :]]
+        return block.T.reshape((len(tags),) + grid[0].shape)
+
+    def inference(self, x, decode, k=None, verbose=False, workers=1, chunk_size=200):
+        '''
+        Decode sentences with 'viterbi' or 'beam' (k required).
+        With workers > 1, chunks of chunk_size sentences are decoded in parallel processes.
+        '''
+        self._refresh()
+        if workers > 1:
+            return self._parallel_inference(x, decode, k, workers, chunk_size)
+        if decode == 'beam':
+            assert k is not None
+            pred_y = self._beam(x, k, verbose)
+        elif decode == 'viterbi':
+            pred_y = self._viterbi(x, verbose)
+        else:
+            raise NotImplementedError('Decode method not implemented.')
+        return pred_y
+
+    def _parallel_inference(self, x, decode, k, workers, chunk_size):
+        '''
+        Decode chunks of sentences in a pool of forked processes. Workers inherit the
+        trained tables from this process, so only sentences and predicted tags are
+        pickled. Predictions are returned in input order.
+        '''
+        global _worker_hmm
+        chunks = [(x[i:i + chunk_size], decode, k) for i in range(0, len(x), chunk_size)]
+        _worker_hmm = self
+        try:
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                pred_chunks = pool.map(_decode_chunk, chunks)
+        finally:
+            # do not keep the model referenced after the pool, even if decoding failed
+            _worker_hmm = None
+        return [seq for pred_y in pred_chunks for seq in pred_y]
+
+    def _beam(self, x, k, verbose):
+        '''
+        Beam search. All successors of the beam are scored as one
+        (beam size, #allowed tags) array. Successors ending with the same ngram - 1
+        tags are merged since only the best of them can be extended to the best
+        sequence, then the top k survive through argpartition. Back pointers are
+        kept in preallocated int arrays instead of copied sequences.
+        '''
+        pred_y = []
+        num_tags = len(self.tag_list)
+        for c, sentence in enumerate(x):
+            words = [word for word in sentence if word != '*']
+            beam_tags = np.zeros((len(words), k), dtype=np.int64)     # last tag of each beam entry
+            back_pointers = np.zeros((len(words), k), dtype=np.int64) # beam entry extended at previous step
+            histories = np.full((1, self.ngram - 1), self.tag_ids['*']) # previous tags, nearest first
+            total_scores = np.zeros(1)
+            for i, word in enumerate(words):
+                allowed_tags, emission = self._allowed_tags(word)
+                rows = self._context_rows(list(histories.T))
+                # scores[b, T] = total_scores[b] + q(T | histories[b]) + e(word | T)
+                scores = (total_scores[:, np.newaxis]
+                          + self.transition_rows[rows[:, np.newaxis], allowed_tags[np.newaxis, :]]
+                          + emission[np.newaxis, :])
+                valid = np.isfinite(scores)
+                if not valid.any():
+                    valid[:] = True
+                parents, columns = np.nonzero(valid)
+                tags = allowed_tags[columns]
+                candidate_scores = scores[parents, columns]
+                # keep the best candidate for each state, i.e. its last ngram - 1 tags
+                states = tags
+                for V in histories[parents, :self.ngram - 2].T:
+                    states = states * num_tags + V
+                order = np.lexsort((-candidate_scores, states))
+                _, first = np.unique(states[order], return_index=True)
+                best = order[first]
+                if len(best) > k:
+                    best = best[np.argpartition(-candidate_scores[best], k - 1)[:k]]
+                beam_tags[i, :len(best)] = tags[best]
+                back_pointers[i, :len(best)] = parents[best]
+                histories = np.hstack([tags[best, np.newaxis], histories[parents[best], :-1]])
+                total_scores = candidate_scores[best]
+            seqs = [self._backtrack(beam_tags, back_pointers, b) for b in range(len(total_scores))]
+            if verbose and c % 50 == 0:
+                print('%dth sentence:' % c)
+                for seq in seqs:
+                    print(seq)
+            pred_y.append(seqs[np.argmax(total_scores)])
+        return pred_y
+
+    def _backtrack(self, beam_tags, back_pointers, b):
+        '''
+        Follow back pointers from entry b of the last beam and return the tag sequence.
+        '''
+        seq = []
+        for i in reversed(range(len(beam_tags))):
+            seq.append(self.tag_list[beam_tags[i, b]])
+            b = back_pointers[i, b]
+        return ['*'] * (self.ngram - 1) + seq[::-1]
+
+    def _viterbi(self, x, verbose):
+        '''
+        Viterbi decoding over the lattice of allowed tags. pi[N, V1, ..., Vn-2] holds
+        the best score of sequences ending with tags (..., Vn-2, ..., V1, N), so every
+        step is a single max/argmax over the previous pi broadcast against a block
+        of transition probabilities.
+        '''
+        pred_y = []
+        start = np.array([self.tag_ids['*']])
+        for c, sentence in enumerate(x):
+            pi = np.zeros((1,) * (self.ngram - 1))
+            tag_sets = [start] * (self.ngram - 1) # allowed tags of each position
+            back_pointers = []
+            for word in sentence:
+                if word == '*':
+                    continue
+                allowed_tags, emission = self._allowed_tags(word)
+                # scores[N, V1, ..., Vn-1] = pi[V1, ..., Vn-1] + q(N | V1, ..., Vn-1) + e(word | N)
+                transitions = self._transition_block(allowed_tags, tag_sets[:-self.ngram:-1])
+                emission = emission.reshape((-1,) + (1,) * (self.ngram - 1))
+                scores = pi[np.newaxis] + transitions + emission
+                back_pointers.append(np.argmax(scores, axis=-1))
+                pi = np.max(scores, axis=-1)
+                tag_sets.append(allowed_tags)
+            # generate sequence from back pointers, starting from the best last state
+            seq = list(np.unravel_index(np.argmax(pi), pi.shape))
+            for back_pointer in reversed(back_pointers):
+                seq.append(back_pointer[tuple(seq[-(self.ngram - 1):])])
+            seq = [self.tag_list[tags[i]] for tags, i in zip(tag_sets, reversed(seq))]
+            pred_y.append(seq)
+            if verbose and c % 50 == 0:
+                print('%dth sentence:' % c)
+                print(seq)
+        return pred_y
+
+    def accuracy(self, dev_x, dev_y, decode, k=None, verbose=False, workers=1):
+        pred_y = self.inference(dev_x, decode, k, verbose, workers)
+        num_correct = 0
+        total = 0
+        for pred_seq, dev_seq in zip(pred_y, dev_y):
+            for y_, y in zip(pred_seq, dev_seq):
+                if y == '*' or y == '<STOP>':
+                    continue
+                if y_ == y:
+                    num_correct += 1
+                total += 1
+        return num_correct / total
+
+    def find_suboptimal_sequences(self, x, y, decode, k=None, verbose=False, workers=1):
+        pred_y = self.inference(x, decode, k, verbose, workers)
+        num_suboptimal = 0
+        num_completely_correct = 0
+        idx = 0
+        for sentence, pred_seq, gold_seq in zip(x, pred_y, y):
+            pred_score = self._sequence_score(sentence, pred_seq)
+            gold_score = self._sequence_score(sentence, gold_seq)
+            if gold_score == pred_score:
+                num_completely_correct += 1
+            if gold_score > pred_score:
+                num_suboptimal += 1
+                print('[%d] Predicted seq:' % idx)
+                print(pred_seq)
+                print('[%d] Gold seq:' % idx)
+                print(gold_seq)
+                print()
+            idx += 1
+        return num_suboptimal / len(x), num_completely_correct / len(x)
+
+    def _sequence_score(self, sentence, tags):
+        '''
+        Return the log joint probability of a sentence and a tag sequence (paddings included).
+        '''
+        tag_ids = np.array([self.tag_ids[tag] for tag in tags])
+        positions = np.flatnonzero(tag_ids != self.tag_ids['*'])
+        rows = self._context_rows([tag_ids[positions - j] for j in range(1, self.ngram)])
+        score = 0
+        for i, row in zip(positions, rows):
+            score += (self.transition_rows[row, tag_ids[i]]
+                      + self._emission_column(sentence[i])[tag_ids[i]])
+        return score
+
+
+def generate_submission(pred_sequences, filename='hmm_sample'):
+    with open('./results/' + filename + '.csv', 'w') as f:
+        f.write('id,tag\n')
+        idx = 0
+        for seq in pred_sequences:
+            for tag in seq:
+                if tag == '*' or tag == '<STOP>':
+                    continue
+                f.write('{},"{}"\n'.format(idx, tag))
+                idx += 1
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--ngram', dest='ngram', type=int, default=3,
+                        help='order of the HMM, e.g. 2 for bigram, 4 for 4-gram')
+    args = parser.parse_args()
+
+    loader = Loader(ngram=args.ngram)
+    train_x, train_y = loader.load_data('train')
+    dev_x, dev_y = loader.load_data('dev')
+    test_x, _ = loader.load_data('test')
+    print('Done loading data.')
+
+    hmm = HMM(tag_vocab=loader.tag_vocab, ngram=args.ngram)
+    # smooth can be either 'add_one' or 'linear_interpolate' (one lambda per order)
+#    hmm.train(train_x, train_y, smooth='linear_interpolate', lambdas=(0.1, 0.3, 0.6))
+    hmm.train(train_x, train_y, smooth='add_one')
+    print('Done training.')
+
+    # inference
+    dev_acc = hmm.accuracy(dev_x, dev_y, decode='viterbi', verbose=False)
+    print('Dev accuracy (viterbi):', dev_acc)
+    dev_acc = hmm.accuracy(dev_x, dev_y, decode='beam', k=3, verbose=False)
+    print('Dev accuracy (beam):', dev_acc)
+
+    # generate submission .csv file
+#    pred_y = hmm.inference(test_x, decode='viterbi')
+#    generate_submission(pred_y, filename='hmm_%dgram_add_one_viterbi' % args.ngram)
@@ -1,5 +1,7 @@
 import numpy as np
 import csv
+import json
+import os
 
 
 class Loader:
@@ -10,6 +12,7 @@ class Loader:
         self.tag_vocab = set(['*', '<STOP>'])
         self.common_set = None
         self.rare_set = None
+        self.word_counts = None
         self.suffix_size = suffix_size
 
     def load_data(self, mode):
@@ -23,11 +26,94 @@ class Loader:
         '''
         sentences, labels = self._build_raw_sentences(mode)
         if mode == 'train':
-            counts = self._build_count_dict(sentences)
-            self.common_set, self.rare_set = self._build_buckets(counts)
+            self.word_counts = self._build_count_dict(sentences)
+            self.common_set, self.rare_set = self._build_buckets(self.word_counts)
         sentences = self._build_data(sentences, mode)
         return sentences, labels
 
+    def build_buckets(self):
+        '''
+        Build common/rare buckets from training data in one streaming pass.
+        The tag vocabulary is collected along the way.
+        '''
+        self.word_counts = self._build_count_dict(sentence for sentence, _ in self._read_sentences('train'))
+        self.common_set, self.rare_set = self._build_buckets(self.word_counts)
+
+    def update_buckets(self, sentences):
+        '''
+        Extend word counts and common/rare buckets with new training sentences,
+        giving the same buckets as building them from all sentences seen so far.
+        Sentences counted before keep the tokens they were mapped to, e.g. a word
+        that becomes common is only counted as itself from now on.
+        Args:
+            sentences: List[List[str]], new raw sentences with paddings
+        Returns:
+            sentences_: List[List[str]], new sentences mapped with the updated buckets
+        '''
+        if self.word_counts is None:
+            raise ValueError('No word counts to update, build buckets from training data first.')
+        suffix_size = self.suffix_size
+        left_rare = set() # suffixes of words whose count is no longer 2
+        for word, count in self._build_count_dict(sentences).items():
+            old_count = self.word_counts.get(word, 0)
+            self.word_counts[word] = old_count + count
+            if old_count + count > 2:
+                self.common_set.add(word)
+            if old_count + count == 2:
+                self.rare_set.add(word[-suffix_size:])
+            elif old_count == 2:
+                left_rare.add(word[-suffix_size:])
+        if left_rare:
+            # a suffix stays rare while another word with that suffix has count 2
+            left_rare -= {word[-suffix_size:] for word, count in self.word_counts.items() if count == 2}
+            self.rare_set -= left_rare
+        return self._build_data(sentences, 'train')
+
+    def stream_data(self, mode):
+        '''
+        Stream data one sentence at a time. Memory is bounded by the size of 
+        the buckets, not by the size of the corpus. Buckets are built first 
+        if they are not available yet, which takes one extra pass over training data.
+        Args:
+            mode: str, 'train', 'dev', or 'test'
+        Yields:
+            sentence: List[str], final sentence
+            tags: List[str], labels of the sentence, None for test data
+        '''
+        if self.common_set is None:
+            self.build_buckets()
+        for sentence, tags in self._read_sentences(mode):
+            yield [self._bucket(word)[0] for word in sentence], tags
+
+    def save_buckets(self, path):
+        '''
+        Save the tag vocabulary, the common/rare buckets and the word counts built from
+        training data to path/buckets.json, so test data can be loaded without reading
+        training data and buckets can still be updated.
+        '''
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'buckets.json'), 'w') as f:
+            json.dump({'ngram': self.ngram,
+                       'suffix_size': self.suffix_size,
+                       'tag_vocab': sorted(self.tag_vocab),
+                       'common_set': sorted(self.common_set),
+                       'rare_set': sorted(self.rare_set),
+                       'word_counts': self.word_counts}, f)
+
+    def load_buckets(self, path):
+        '''
+        Load buckets written by save_buckets().
+        '''
+        with open(os.path.join(path, 'buckets.json')) as f:
+            buckets = json.load(f)
+        if buckets['ngram'] != self.ngram:
+            raise ValueError('Buckets were built for {}-gram paddings.'.format(buckets['ngram']))
+        self.suffix_size = buckets['suffix_size']
+        self.tag_vocab = set(buckets['tag_vocab'])
+        self.common_set = set(buckets['common_set'])
+        self.rare_set = set(buckets['rare_set'])
+        self.word_counts = buckets['word_counts']
+
     def _build_raw_sentences(self, mode):
         '''
         Load raw sentences and labels from file
@@ -38,9 +124,25 @@ class Loader:
             sentences: List[List[str]], raw sentences with paddings
             labels: List[List[str]], raw labels with paddings
         '''
-        ngram = self.ngram
         sentences = []
         labels = []
+        for sentence, tags in self._read_sentences(mode):
+            sentences.append(sentence)
+            if tags is not None:
+                labels.append(tags)
+        return sentences, labels
+
+    def _read_sentences(self, mode):
+        '''
+        Read raw sentences and labels from file one at a time 
+        and add paddings e.g. '*' and '<STOP>'.
+        Args:
+            mode: str, 'train', 'dev', or 'test'
+        Yields:
+            sentence: List[str], raw sentence with paddings
+            tags: List[str], raw labels with paddings, None for test data
+        '''
+        ngram = self.ngram
         if mode == 'train' or mode == 'dev':
             with open(self.data_path.format(mode)) as f_input, open(self.label_path.format(mode)) as f_label:
                 next(f_input)
@@ -54,8 +156,7 @@ class Loader:
                     tags.append(tag)
                     self.tag_vocab.add(tag) # build vocab for tags
                     if word == '.' or word == '?':
-                        sentences.append(sentence + ['<STOP>'])
-                        labels.append(tags + ['<STOP>'])
+                        yield sentence + ['<STOP>'], tags + ['<STOP>']
                         sentence = ['*'] * (ngram - 1)
                         tags = ['*'] * (ngram - 1)
         elif mode == 'test':
@@ -66,9 +167,8 @@ class Loader:
                     word = input_line[1]
                     sentence.append(word)
                     if word == '.' or word == '?':
-                        sentences.append(sentence + ['<STOP>'])
+                        yield sentence + ['<STOP>'], None
                         sentence = ['*'] * (ngram - 1)
-        return sentences, labels
 
     def _build_count_dict(self, sentences):
         counts = {}
@@ -109,30 +209,41 @@ class Loader:
             sentences: List[List[str]], raw sentences with paddings
             mode: str, 'train', 'dev', or 'test'
         Returns:
-            sentences_: List[List[str]], final sentences
+            sentences_: List[List[str]], final sentences (raw sentences are left untouched)
         '''
         bucket_counts = {'common': 0, 'rare': 0, 'unk': 0}
-        sentences_ = sentences[:]
-        for i, sentence in enumerate(sentences):
-            for j, word in enumerate(sentence):
-                if word == '*' or word == '<STOP>':
-                    continue
-                suffix = word[-self.suffix_size:] # use suffix to collect unseen words
-                if word in self.common_set:
-                    sentences_[i][j] = word
-                    bucket_counts['common'] += 1
-                elif suffix in self.rare_set:
-                    sentences_[i][j] = suffix
-                    bucket_counts['rare'] += 1
-                else:
-                    sentences_[i][j] = '<UNK>'
-                    bucket_counts['unk'] += 1
+        sentences_ = []
+        for sentence in sentences:
+            sentence_ = []
+            for word in sentence:
+                word_, bucket = self._bucket(word)
+                sentence_.append(word_)
+                if bucket is not None:
+                    bucket_counts[bucket] += 1
+            sentences_.append(sentence_)
         print('Mode %s' % mode)
         print('  Common words:', bucket_counts['common'])
         print('  Rare words:', bucket_counts['rare'])
         print('  Unseen words:', bucket_counts['unk'])
         return sentences_
 
+    def _bucket(self, word):
+        '''
+        Map a word to itself, its suffix or '<UNK>'.
+        Returns:
+            word_: str, final token
+            bucket: str, 'common', 'rare' or 'unk', None for paddings
+        '''
+        if word == '*' or word == '<STOP>':
+            return word, None
+        suffix = word[-self.suffix_size:] # use suffix to collect unseen words
+        if word in self.common_set:
+            return word, 'common'
+        elif suffix in self.rare_set:
+            return suffix, 'rare'
+        else:
+            return '<UNK>', 'unk'
+
 
 if __name__ == '__main__':
     loader = Loader(ngram=3)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import multiprocessing
+import time
+from argparse import ArgumentParser
+from hmm_loader import Loader
+from hmm import HMM
+
+
+def worker_counts(max_workers):
+    '''
+    Return 1, 2, 4, ... up to max_workers (max_workers itself included).
+    '''
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    return counts + [max_workers]
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--ngram', dest='ngram', type=int, default=3,
+                        help='order of the HMM, e.g. 2 for bigram, 3 for trigram')
+    parser.add_argument('-d', '--decode', dest='decode', default='viterbi',
+                        help="'viterbi' or 'beam'")
+    parser.add_argument('-k', dest='k', type=int, default=3,
+                        help='beam size, only used for beam search')
+    parser.add_argument('-w', '--max_workers', dest='max_workers', type=int,
+                        default=multiprocessing.cpu_count(), help='largest number of worker processes')
+    parser.add_argument('-c', '--chunk_size', dest='chunk_size', type=int, default=200,
+                        help='number of sentences sent to a worker at a time')
+    args = parser.parse_args()
+
+    loader = Loader(ngram=args.ngram)
+    train_x, train_y = loader.load_data('train')
+    dev_x, dev_y = loader.load_data('dev')
+    print('Done loading data.')
+
+    hmm = HMM(tag_vocab=loader.tag_vocab, ngram=args.ngram)
+    hmm.train(train_x, train_y, smooth='add_one')
+    print('Done training.')
+
+    num_tokens = sum(len(sentence) for sentence in dev_x)
+    base_time = None
+    base_pred_y = None
+    print('{:>8} {:>10} {:>12} {:>8} {:>10}'.format('workers', 'time (s)', 'tokens/s', 'speedup', 'same tags'))
+    for workers in worker_counts(args.max_workers):
+        start = time.time()
+        pred_y = hmm.inference(dev_x, decode=args.decode, k=args.k,
+                               workers=workers, chunk_size=args.chunk_size)
+        secs = time.time() - start
+        base_time = base_time or secs
+        base_pred_y = base_pred_y or pred_y
+        print('{:>8} {:>10.2f} {:>12.0f} {:>8.2f} {:>10}'.format(
+            workers, secs, num_tokens / secs, base_time / secs, str(pred_y == base_pred_y)))
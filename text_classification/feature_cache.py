@@ -0,0 +1,114 @@
+import functools
+import hashlib
+import inspect
+import os
+import numpy as np
+from scipy import sparse
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+CACHE_VERSION = 2 # bump when the layout of the cache files changes
+MODES = ['train', 'dev', 'test']
+
+
+def cached(method):
+    '''
+    Cache the features returned by a Loader method in CACHE_DIR/<key>.npz, where key is
+    a hash of the data files, the method name, its arguments (defaults included, e.g.
+    ngram_range, dim_used, tokenize) and the source of the whole features module, so
+    editing the method or any helper it calls (_load_data, tokenizers, ...) invalidates
+    the cached features. A later call with the same key
+    loads the matrices, labels and vocab_x, vocab_y, class_dict of the Loader instead
+    of reading the CSVs and refitting the vectorizer. Loader(..., cache=False) bypasses it.
+    '''
+    signature = inspect.signature(method)
+    with open(inspect.getsourcefile(method)) as f:
+        source = f.read()
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.cache:
+            return method(self, *args, **kwargs)
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        params = sorted((name, value) for name, value in bound.arguments.items() if name != 'self')
+        key = _key(self.data_path, method.__name__, params, source)
+        path = os.path.join(CACHE_DIR, key + '.npz')
+        if os.path.exists(path):
+            return _load(self, path)
+        features = method(self, *args, **kwargs)
+        _save(self, path, features)
+        return features
+    return wrapper
+
+
+def _key(data_path, name, params, source):
+    digest = hashlib.sha1()
+    for mode in MODES:
+        for kind in ['data', 'labels']:
+            file_path = os.path.join(data_path, mode, '{}_{}.csv'.format(mode, kind))
+            if not os.path.exists(file_path):
+                continue
+            digest.update(file_path.encode('utf-8'))
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    digest.update(repr((CACHE_VERSION, name, params, source)).encode('utf-8'))
+    return '{}_{}'.format(name, digest.hexdigest()[:16])
+
+
+def _save(loader, path, features):
+    '''
+    Store each returned array and the vocabularies of loader in one uncompressed .npz,
+    written atomically. Feature matrices, sparse or dense, are stored by their CSR
+    components, so the file size and load time scale with the number of nonzeros;
+    dense ones are marked to be densified again on load.
+    '''
+    arrays = {'num_features': len(features)}
+    for i, X in enumerate(features):
+        if X is None:
+            arrays['{}_none'.format(i)] = True
+        elif sparse.issparse(X) or np.ndim(X) == 2:
+            if not sparse.issparse(X):
+                arrays['{}_todense'.format(i)] = True
+            X = sparse.csr_matrix(X)
+            arrays.update({'{}_data'.format(i): X.data, '{}_indices'.format(i): X.indices,
+                           '{}_indptr'.format(i): X.indptr, '{}_shape'.format(i): X.shape})
+        else:
+            arrays['{}_dense'.format(i)] = X
+    for name in ['vocab_x', 'vocab_y', 'class_dict']:
+        mapping = getattr(loader, name)
+        if mapping is not None:
+            arrays[name + '_keys'] = _object_array(mapping.keys())
+            arrays[name + '_values'] = _object_array(mapping.values())
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    np.savez(path + '.tmp.npz', **arrays)
+    os.replace(path + '.tmp.npz', path)
+
+
+def _load(loader, path):
+    with np.load(path, allow_pickle=True) as f:
+        features = []
+        for i in range(int(f['num_features'])):
+            if '{}_none'.format(i) in f:
+                features.append(None)
+            elif '{}_dense'.format(i) in f:
+                features.append(f['{}_dense'.format(i)])
+            else:
+                X = sparse.csr_matrix(
+                    (f['{}_data'.format(i)], f['{}_indices'.format(i)], f['{}_indptr'.format(i)]),
+                    shape=tuple(f['{}_shape'.format(i)]))
+                # methods returning dense arrays (e.g. propernames char_ngram) get them back dense
+                features.append(X.toarray() if '{}_todense'.format(i) in f else X)
+        for name in ['vocab_x', 'vocab_y', 'class_dict']:
+            if name + '_keys' in f:
+                setattr(loader, name, dict(zip(f[name + '_keys'].tolist(), f[name + '_values'].tolist())))
+    return tuple(features)
+
+
+def _object_array(items):
+    # an object array keeps str, int and tuple (n-gram) keys as they are
+    items = list(items)
+    array = np.empty(len(items), dtype=object)
+    for i, item in enumerate(items):
+        array[i] = item
+    return array
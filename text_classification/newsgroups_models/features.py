@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 import numpy as np
 import csv
+import functools
+import multiprocessing
+import os
+from scipy import sparse
 from nltk.tokenize import word_tokenize
 from nltk.stem.wordnet import WordNetLemmatizer
 from nltk.stem.porter import PorterStemmer
@@ -9,6 +13,9 @@ import gensim
 import sys
 import re
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from feature_cache import cached
+
 csv.field_size_limit(sys.maxsize)
 lemmatizer = WordNetLemmatizer()
 stemmer = PorterStemmer()
@@ -19,24 +26,77 @@ QUOTE_RE = re.compile(r'(writes in|writes:|wrote:|says:|said:'
 W2V_PATH = 'path/to/file'
 
 
+def normalize_tokens(text, normalize='lemma'):
+    '''
+    Tokenize a text with word_tokenize and keep alphabetic tokens.
+    Args:
+        text: str
+        normalize: str, 'lemma' for lowercased WordNet lemmas, 'stem' for Porter stems,
+                   'lower' for lowercased tokens
+    Returns:
+        tokens: list of str
+    '''
+    words = [w for w in word_tokenize(text) if w.isalpha()]
+    if normalize == 'lemma':
+        return [lemmatizer.lemmatize(w.lower()) for w in words]
+    elif normalize == 'stem':
+        return [stemmer.stem(w) for w in words]
+    elif normalize == 'lower':
+        return [w.lower() for w in words]
+    raise ValueError('Not a valid normalization.')
+
+
+def tokenize_parallel(texts, normalize='lemma', workers=None, chunk_size=100):
+    '''
+    Run normalize_tokens over texts in a process pool, chunk_size texts per task.
+    Args:
+        texts: iterable of str
+        normalize: str, see normalize_tokens
+        workers: int, number of processes, all cores by default, 1 to tokenize in this process
+        chunk_size: int, number of texts sent to a worker at a time
+    Returns:
+        tokens: list of list of str, in the order of texts
+    '''
+    tokenize = functools.partial(normalize_tokens, normalize=normalize)
+    if workers == 1:
+        return [tokenize(text) for text in texts]
+    with multiprocessing.Pool(workers) as pool:
+        return pool.map(tokenize, texts, chunksize=chunk_size)
+
+
+def _identity(x):
+    return x
+
+
 class Loader:
-    def __init__(self, dataset):
+    def __init__(self, dataset, workers=None, cache=True):
+        '''
+        Args:
+            dataset: str, 'newsgroups'
+            workers: int, number of processes for tokenization, all cores by default
+            cache: bool, load features from the feature_cache when computed before
+        '''
         if dataset == 'newsgroups':
             self.data_path = '../data/newsgroups/'
         else:
             raise ValueError('Not a valid dataset.')
+        self.workers = workers
+        self.cache = cache
         self.vocab_x = None
         self.vocab_y = None
         self.class_dict = None    
 
-    def bow(self, ngram_range=(1, 1), dim_used=None):
+    @cached
+    def bow(self, ngram_range=(1, 1), dim_used=None, tokenize=None):
         '''
         Bag-of-word feature for newsgroups classification.
         Args:
             ngram_range: tuple, the range for min to max grams used.
             dim_used: int, the number of maximum features for constructing bow model
+            tokenize: str, None for the vectorizer's own tokenizer, or a normalize_tokens
+                      normalization ('lemma', 'stem', 'lower') run in a process pool
         Returns:
-            X_train, X_dev, X_test: ndarray of one-hot encoding with shape (#samples, len of vocabulary)
+            X_train, X_dev, X_test: scipy.sparse CSR matrix of one-hot encoding with shape (#samples, len of vocabulary)
             Y_train, Y_dev: labels in vector form with class ids (not one-hot), shape (#samples,)
         Store:
             vocab_x: dict, mapping from words to indices
@@ -49,22 +109,26 @@ class Loader:
         vectorizer = CountVectorizer(max_features=dim_used, 
                                      ngram_range=ngram_range, 
 #                                     stop_words=stopwords,
-#                                     tokenizer=self._stem_tokenize, 
-                                     binary=True)
-        X_train = vectorizer.fit_transform(texts_train).toarray()
-        X_dev = vectorizer.transform(texts_dev).toarray()
-        X_test = vectorizer.transform(texts_test).toarray()
+                                     binary=True,
+                                     **self._vectorizer_args(tokenize))
+        docs_train, docs_dev, docs_test = self._documents([texts_train, texts_dev, texts_test], tokenize)
+        X_train = vectorizer.fit_transform(docs_train).tocsr()
+        X_dev = vectorizer.transform(docs_dev).tocsr()
+        X_test = vectorizer.transform(docs_test).tocsr()
         self.vocab_x = vectorizer.vocabulary_
         return X_train, Y_train, X_dev, Y_dev, X_test
 
-    def tfidf(self, ngram_range=(1, 1), dim_used=None):
+    @cached
+    def tfidf(self, ngram_range=(1, 1), dim_used=None, tokenize=None):
         '''
         Bag-of-word feature for newsgroups classification.
         Args:
             ngram_range: tuple, the range for min to max grams used.
             dim_used: int, the number of maximum features for constructing bow model
+            tokenize: str, None for the vectorizer's own tokenizer, or a normalize_tokens
+                      normalization ('lemma', 'stem', 'lower') run in a process pool
         Returns:
-            X_train, X_dev, X_test: ndarray of one-hot encoding with shape (#samples, len of vocabulary)
+            X_train, X_dev, X_test: scipy.sparse CSR matrix of tf-idf weights with shape (#samples, len of vocabulary)
             Y_train, Y_dev: labels in vector form with class ids (not one-hot), shape (#samples,)
         Store:
             vocab_x: dict, mapping from words to indices
@@ -75,12 +139,13 @@ class Loader:
         with open('stopwords.txt') as f:
             stopwords = [word.strip() for word in f.readlines()]
         vectorizer = TfidfVectorizer(max_features=dim_used, 
-#                                     tokenizer=self._stem_tokenize,
 #                                     stop_words=stopwords,
-                                     ngram_range=ngram_range)
-        X_train = vectorizer.fit_transform(texts_train).toarray()
-        X_dev = vectorizer.transform(texts_dev).toarray()
-        X_test = vectorizer.transform(texts_test).toarray()
+                                     ngram_range=ngram_range,
+                                     **self._vectorizer_args(tokenize))
+        docs_train, docs_dev, docs_test = self._documents([texts_train, texts_dev, texts_test], tokenize)
+        X_train = vectorizer.fit_transform(docs_train).tocsr()
+        X_dev = vectorizer.transform(docs_dev).tocsr()
+        X_test = vectorizer.transform(docs_test).tocsr()
         self.vocab_x = vectorizer.vocabulary_
         return X_train, Y_train, X_dev, Y_dev, X_test
 
@@ -99,9 +164,8 @@ class Loader:
         X_test = np.zeros((texts_test.shape[0], 300))
         datasets = [X_train, X_dev, X_test]
 
-        for i, texts in enumerate([texts_train, texts_dev, texts_test]):
-            for j, text in enumerate(texts):
-                words = [w.lower() for w in word_tokenize(text) if w.isalpha()]
+        for i, docs in enumerate(self._documents([texts_train, texts_dev, texts_test], 'lower')):
+            for j, words in enumerate(docs):
                 num_words = 0
                 for word in words:
                     if word in stopwords:
@@ -113,13 +177,14 @@ class Loader:
         
         return X_train, Y_train, X_dev, Y_dev, X_test
 
+    @cached
     def bow_(self, dim_used=5000):
         '''
         Bag-of-word feature for newsgroups classification.
         Args:
             None
         Returns:
-            X_train, X_dev, X_test: ndarray of one-hot encoding with shape (#samples, len of vocabulary)
+            X_train, X_dev, X_test: scipy.sparse CSR matrix of one-hot encoding with shape (#samples, len of vocabulary)
             Y_train, Y_dev: labels in vector form with class ids (not one-hot), shape (#samples,)
         Store:
             vocab_x: dict, mapping from words to indices
@@ -131,13 +196,12 @@ class Loader:
         datasets = []
 
         # build vocab_x        
-        for texts in [texts_train, texts_dev, texts_test]:
+        for docs in self._documents([texts_train, texts_dev, texts_test], 'lemma'):
             X_tmp = []
             idx = 0
             with open('stopwords.txt') as f:
                 stopwords = set([w.strip() for w in f.readlines()])
-            for text in texts:
-                words = [lemmatizer.lemmatize(w.lower()) for w in word_tokenize(text) if w.isalpha()]
+            for words in docs:
                 X_tmp.append([])
                 for word in words:
                     if word in stopwords:
@@ -149,17 +213,25 @@ class Loader:
             self.vocab_x = vocab_x
             datasets.append(X_tmp)
 
-        # generate data
-        X_train = np.zeros((texts_train.shape[0], len(vocab_x)))
-        X_dev = np.zeros((texts_dev.shape[0], len(vocab_x)))
-        X_test = np.zeros((texts_test.shape[0], len(vocab_x)))
-
-        for X_tmp, X in zip(datasets, [X_train, X_dev, X_test]):
-            for i in range(len(X_tmp)):
-                for word in X_tmp[i]:
-                    if word in vocab_x:
-                        X[i][vocab_x[word]] = 1 # presence/absence
-        return X_train[:, :dim_used], Y_train, X_dev[:, :dim_used], Y_dev, X_test[:, :dim_used]
+        # generate data, only the word ids present in each text are stored
+        X_train, X_dev, X_test = [self._presence_matrix(X_tmp, vocab_x)[:, :dim_used] for X_tmp in datasets]
+        return X_train, Y_train, X_dev, Y_dev, X_test
+
+    def _presence_matrix(self, texts, vocab_x):
+        '''
+        Args:
+            texts: list of list of words
+            vocab_x: dict, mapping from words to indices
+        Returns:
+            X: scipy.sparse CSR matrix with X[i, vocab_x[word]] = 1 for each word of texts[i] in vocab_x
+        '''
+        indptr = [0]
+        indices = []
+        for words in texts:
+            indices.extend(sorted(set(vocab_x[word] for word in words if word in vocab_x))) # presence/absence
+            indptr.append(len(indices))
+        data = np.ones(len(indices))
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(texts), len(vocab_x)))
     
     def _load_data(self, mode):
         '''
@@ -224,9 +296,29 @@ class Loader:
             raise ValueError('Not a valid mode.')
         return texts, Y
 
-    def _stem_tokenize(self, text):
-        tokens = [stemmer.stem(item) for item in word_tokenize(text) if item.isalpha()]
-        return tokens
+    def _documents(self, texts_list, tokenize):
+        '''
+        Tokenize the texts of all splits in one process pool.
+        Args:
+            texts_list: list of ndarray of strings, e.g. train, dev and test texts
+            tokenize: str, normalize_tokens normalization, None to return the texts unchanged
+        Returns:
+            docs_list: list of list of token lists (or the texts), one per split
+        '''
+        if tokenize is None:
+            return texts_list
+        tokens = tokenize_parallel([text for texts in texts_list for text in texts], tokenize, self.workers)
+        bounds = np.cumsum([0] + [len(texts) for texts in texts_list])
+        return [tokens[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def _vectorizer_args(self, tokenize):
+        '''
+        Vectorizer arguments taking token lists from _documents as documents, so the
+        vectorizer skips its own tokenization while ngram_range and stop_words still apply.
+        '''
+        if tokenize is None:
+            return {}
+        return dict(preprocessor=_identity, tokenizer=_identity, lowercase=False, token_pattern=None)
 
     def _strip_header(self, text):
         _before, _blankline, after = text.partition('\n\n')
@@ -259,6 +351,69 @@ class Loader:
             return text
 
 
+def write_shards(X, Y, directory, shard_size=1000):
+    '''
+    Write a feature matrix to disk as shards of shard_size rows, so it can be streamed
+    by MaxEnt.train_sgd. Call it again with the next part of a corpus that does not fit
+    in memory; shards are numbered after the existing ones.
+    Args:
+        X: scipy.sparse matrix or ndarray with shape (#samples, #features)
+        Y: labels in vector form with class ids, shape (#samples,)
+        directory: str, created if missing
+        shard_size: int, number of rows per shard
+    '''
+    os.makedirs(directory, exist_ok=True)
+    X = sparse.csr_matrix(X)
+    first = len(_shard_paths(directory))
+    for i, start in enumerate(range(0, X.shape[0], shard_size)):
+        shard = X[start:start + shard_size]
+        np.savez(os.path.join(directory, 'shard_{:05d}.npz'.format(first + i)),
+                 data=shard.data, indices=shard.indices, indptr=shard.indptr,
+                 shape=shard.shape, Y=Y[start:start + shard_size])
+
+
+def read_shards(directory, shuffle=False):
+    '''
+    Yield the shards written by write_shards one at a time, so memory is bounded by one shard.
+    Args:
+        shuffle: bool, visit the shards in random order
+    Yields:
+        X: scipy.sparse CSR matrix of the shard
+        Y: labels of the shard
+    '''
+    paths = _shard_paths(directory)
+    if shuffle:
+        paths = [paths[i] for i in np.random.permutation(len(paths))]
+    for path in paths:
+        with np.load(path) as f:
+            yield sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape'])), f['Y']
+
+
+def shard_info(directory):
+    '''
+    Returns:
+        N: int, number of samples over all shards
+        block_size: int, number of features
+        num_classes: int, largest class id + 1
+    '''
+    N, block_size, num_classes = 0, 0, 0
+    for path in _shard_paths(directory):
+        # members of an npz are read lazily, the feature arrays are not loaded
+        with np.load(path) as f:
+            N += int(f['shape'][0])
+            block_size = int(f['shape'][1])
+            num_classes = max(num_classes, int(np.max(f['Y'])) + 1)
+    return N, block_size, num_classes
+
+
+def _shard_paths(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith('shard_') and name.endswith('.npz'))
+
+
+
 if __name__ == '__main__':
 
     loader = Loader('newsgroups')
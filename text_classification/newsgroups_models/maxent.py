@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 import numpy as np
 import scipy.optimize as opt
-from features import Loader
+from argparse import ArgumentParser
+from features import Loader, read_shards, shard_info, write_shards
 
 
 class MaxEnt:
@@ -12,60 +13,139 @@ class MaxEnt:
         self.num_classes = None
 
     def train(self, X, Y, lmda=1):
+        '''
+        Args:
+            X: ndarray or scipy.sparse matrix with shape (#samples, #features)
+            Y: ndarray of class ids with shape (#samples,)
+            lmda: float, L2 regularization strength
+        '''
         self.N, self.block_size = X.shape
         self.num_classes = max(Y) + 1
         self.W = np.zeros(self.block_size * self.num_classes)
         
-        # start optimization
+        # start optimization, loss and gradient come from one pass over X
         self.W, loss, info = opt.fmin_l_bfgs_b(
-            self._log_likelihood, 
+            self._loss_grad, 
             x0=self.W,
-            args=(X, Y, lmda), 
-            fprime=self._log_likelihood_grad, 
-            approx_grad=False,
+            args=(X, self._onehot_encode(Y), lmda), 
             iprint=1)
 
-    def _log_likelihood(self, para, *args):
-        X, Y, lmda = args
-        W = para
-        W_ = W.reshape(self.num_classes, self.block_size)
-        probs = self._softmax(np.dot(X, W_.T))
-        L = np.sum(np.log([probs[i][Y[i]] for i in range(self.N)])) 
+    def train_sgd(self, shard_dir, dev=None, lmda=1, num_epochs=10, batch_size=128, learning_rate=0.1,
+                  decay=0., optimizer='adagrad', patience=None):
+        '''
+        Train the same L2-regularized objective as train with mini-batches streamed
+        from the shards written by features.write_shards, so memory is constant in
+        the number of samples: only one shard and the weights are held at a time.
+        Args:
+            shard_dir: str, directory of training shards
+            dev: (X_dev, Y_dev) or str, dev data or a directory of dev shards, None to skip evaluation
+            lmda: float, L2 regularization strength, as in train
+            num_epochs: int, maximum number of passes over the shards
+            batch_size: int, number of samples per update
+            learning_rate: float, initial learning rate
+            decay: float, learning rate at step t is learning_rate / (1 + decay * t)
+            optimizer: str, 'adagrad' or 'sgd'
+            patience: int, stop after this many epochs without a better dev accuracy, None to run all epochs
+        Returns:
+            best_acc: float, best dev accuracy, whose weights are kept, None without dev
+        '''
+        if optimizer not in ('adagrad', 'sgd'):
+            raise ValueError('Not a valid optimizer.')
+        self.N, self.block_size, self.num_classes = shard_info(shard_dir)
+        if self.N == 0:
+            raise ValueError('No shards found in {}.'.format(shard_dir))
+        self.W = np.zeros(self.block_size * self.num_classes)
+        G = np.zeros_like(self.W) # AdaGrad sum of squared gradients
+
+        step = 0
+        best_acc, best_W, num_worse = None, self.W, 0
+        for epoch in range(num_epochs):
+            loss = 0
+            for X, Y in read_shards(shard_dir, shuffle=True):
+                order = np.random.permutation(X.shape[0])
+                for start in range(0, X.shape[0], batch_size):
+                    idxs = order[start:start + batch_size]
+                    # a batch carries its share of the regularization, so an epoch sums to the full objective
+                    batch_loss, grad = self._loss_grad(self.W, X[idxs], self._onehot_encode(Y[idxs]),
+                                                       lmda * len(idxs) / self.N)
+                    loss += batch_loss
+                    grad /= len(idxs)
+                    lr = learning_rate / (1 + decay * step)
+                    if optimizer == 'adagrad':
+                        G += grad ** 2
+                        self.W -= lr * grad / (np.sqrt(G) + 1e-8)
+                    else:
+                        self.W -= lr * grad
+                    step += 1
+            print('Epoch: {}, loss: {:.6f}'.format(epoch + 1, loss / self.N))
+
+            if dev is None:
+                continue
+            acc = self._score_stream(dev)
+            print('Epoch: {}, dev accuracy: {:.4f}'.format(epoch + 1, acc))
+            if best_acc is None or acc > best_acc:
+                best_acc, best_W, num_worse = acc, self.W.copy(), 0
+            else:
+                num_worse += 1
+                if patience is not None and num_worse >= patience:
+                    print('No better dev accuracy in {} epochs, stop.'.format(num_worse))
+                    break
+        self.W = best_W
+        return best_acc
+
+    def _score_stream(self, dev):
+        '''
+        Accuracy on (X_dev, Y_dev), or on the shards in a directory one shard at a time.
+        '''
+        if isinstance(dev, str):
+            num_correct = 0
+            num_samples = 0
+            for X, Y in read_shards(dev):
+                num_correct += np.sum(self.predict(X) == Y)
+                num_samples += len(Y)
+            return num_correct / num_samples
+        return self.score(*dev)
+
+    def _loss_grad(self, para, *args):
+        '''
+        Negative L2-regularized log likelihood and its gradient, from a single forward pass.
+        Args:
+            para: ndarray with shape (num_classes * block_size,), flattened weights
+            args: X, Y_onehot with shape (#samples, num_classes), lmda
+        Returns:
+            loss: float
+            grad: ndarray with the shape of para
+        '''
+        X, Y_onehot, lmda = args
+        W_ = para.reshape(self.num_classes, self.block_size)
+        log_probs = self._log_softmax(X @ W_.T) # a sparse X is multiplied without densifying
+        L = np.sum(log_probs * Y_onehot)
         L -= 0.5 * lmda * np.sum(W_ ** 2) # regularization
-        return -L
-
-    def _log_likelihood_grad(self, para, *args):
-        X, Y, lmda = args
-        W = para
-        W_ = W.reshape(self.num_classes, self.block_size)
-        dL = np.zeros_like(W_)
-        probs = self._softmax(np.dot(X, W_.T))
-        
-        for i in range(self.num_classes):
-            dL[i] += np.sum(X[Y == i], axis=0) - np.sum(X * probs[:, i].reshape(-1, 1), axis=0)
+        dL = (X.T @ (Y_onehot - np.exp(log_probs))).T # (onehot(Y) - probs).T @ X
         dL -= lmda * W_ # regularization
-        return -dL.flatten()
+        return -L, -np.ravel(dL)
 
-    def _softmax(self, M):
+    def _log_softmax(self, M):
         '''
-        Calculate softmax.
+        Calculate log softmax.
         Args:
             M: Each row contains an inner products vector for all classes (#smaple, num_classes)
                The softmax will be applied on the rows.
         Returns:
-            M: The probability score matrix (along rows)
+            M: The log probability score matrix (along rows)
         '''
-        if M.ndim > 1:
-            M -= np.max(M, axis=1).reshape(M.shape[0], 1)
-            M = np.exp(M) / np.sum(np.exp(M), axis=1).reshape(M.shape[0], 1)
-        else:
-            M -= np.max(M)
-            M = np.exp(M) / np.sum(np.exp(M))
-        return M
+        M = M - np.max(M, axis=1, keepdims=True)
+        return M - np.log(np.sum(np.exp(M), axis=1, keepdims=True))
+
+    def _onehot_encode(self, Y):
+        '''Convert label vector Y into one-hot encoded form.'''
+        Y_onehot = np.zeros((len(Y), self.num_classes))
+        Y_onehot[np.arange(len(Y)), Y] = 1
+        return Y_onehot
 
     def predict(self, X_test):
         W_ = self.W.reshape(self.num_classes, self.block_size)
-        Y_ = np.argmax(np.dot(W_, X_test.T), axis=0)
+        Y_ = np.argmax(X_test @ W_.T, axis=1)
         return Y_
 
     def score(self, X_dev, Y_dev):
@@ -82,12 +162,23 @@ def generate_submission(Y_pred, class_dict, filename='submission'):
 
 
 if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-s', '--sgd', dest='shard_dir',
+                        help='train with mini-batch AdaGrad on the shards in this directory, '
+                             'written from the training features if there are none')
+    args = parser.parse_args()
+
     loader = Loader('newsgroups')
     X_train, Y_train, X_dev, Y_dev, X_test = loader.tfidf(dim_used=20000)
     print('Done loading data.')
 
     maxent = MaxEnt()
-    maxent.train(X_train, Y_train, lmda=1)
+    if args.shard_dir:
+        if shard_info(args.shard_dir)[0] == 0:
+            write_shards(X_train, Y_train, args.shard_dir)
+        maxent.train_sgd(args.shard_dir, dev=(X_dev, Y_dev), lmda=1, patience=3)
+    else:
+        maxent.train(X_train, Y_train, lmda=1)
     print('Done training.')
 
     acc = maxent.score(X_dev, Y_dev)
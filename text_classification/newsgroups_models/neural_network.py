@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import tensorflow as tf
 import numpy as np
+from scipy import sparse
 from features import Loader
 
 
@@ -50,7 +51,7 @@ class NeuralNetwork:
         self.sess.run(tf.global_variables_initializer())
 
         # start training
-        batches_per_epoch = int((len(X) - 1) / batch_size) + 1
+        batches_per_epoch = int((X.shape[0] - 1) / batch_size) + 1
         step = 0
         for X_batch, Y_batch in batch_pairs:
             _, loss, accuracy = self.sess.run(
@@ -61,16 +62,23 @@ class NeuralNetwork:
             step += 1
         return accuracy
 
-    def predict(self, X_test):
-        Y_pred = self.sess.run(self.predictions, feed_dict={self.X: X_test, self.dropout_keep_prob: 1.0})
-        return Y_pred
+    def predict(self, X_test, batch_size=1024):
+        '''
+        Predict batch by batch, so a sparse X_test is only densified batch_size rows at a time.
+        '''
+        Y_pred = [self.sess.run(self.predictions,
+                                feed_dict={self.X: self._dense(X_test[i:i + batch_size]), self.dropout_keep_prob: 1.0})
+                  for i in range(0, X_test.shape[0], batch_size)]
+        return np.concatenate(Y_pred)
 
     def score(self, X_dev, Y_dev):
-        Y_dev = self._onehot_encode(Y_dev)
-        loss, accuracy = self.sess.run(
-            [self.loss, self.accuracy], feed_dict={self.X: X_dev, self.Y: Y_dev, self.dropout_keep_prob: 1.0})
+        accuracy = np.mean(self.predict(X_dev) == Y_dev)
         return accuracy
 
+    def _dense(self, X):
+        '''Densify a slice of a scipy.sparse feature matrix to feed it to the graph.'''
+        return X.toarray() if sparse.issparse(X) else X
+
     def _onehot_encode(self, Y):
         '''Convert label vector Y into one-hot encoded form.'''
         Y_onehot = np.zeros((Y.shape[0], np.max(Y) + 1))
@@ -104,31 +112,30 @@ class NeuralNetwork:
     def _extract_batch(self, X, Y, num_epoch, batch_size, shuffle=True):
         '''Extract batches from training data.
         Args:
-            X: training data, ndarray of one-hot encoding with shape (#samples, len of vocabulary)
+            X: training data, ndarray or scipy.sparse CSR matrix with shape (#samples, len of vocabulary)
             Y: training labels, labels in one-hot encoded form, shape (#samples, num_classes)
             num_epochs: int
             batch_size: int
             shuffle: bool
         Yield:
-            X_batch, Y_batch: Sliced data.
+            X_batch, Y_batch: Sliced data, X_batch densified.
         '''
-        # shuffle data
-        data = np.hstack((X, Y))
-        data_size = data.shape[0]
+        # shuffle indices, rows are gathered and densified one batch at a time
+        data_size = X.shape[0]
         batches_per_epoch = int((data_size - 1) / batch_size) + 1
 
         for epoch in range(num_epoch):
             if shuffle:
                 shuffle_idxs = np.random.permutation(np.arange(data_size))
-                shuffled_data = data[shuffle_idxs]
             else:
-                shuffled_data = data
+                shuffle_idxs = np.arange(data_size)
 
             for batch_num in range(batches_per_epoch):
                 start_idx = batch_num * batch_size
                 end_idx = min((batch_num + 1) * batch_size, data_size)
-                X_batch = shuffled_data[start_idx:end_idx][:, :X.shape[1]]
-                Y_batch = shuffled_data[start_idx:end_idx][:, X.shape[1]:]
+                batch_idxs = shuffle_idxs[start_idx:end_idx]
+                X_batch = self._dense(X[batch_idxs])
+                Y_batch = Y[batch_idxs]
                 yield X_batch, Y_batch
 
 
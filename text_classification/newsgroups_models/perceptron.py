@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import numpy as np
+from scipy import sparse
 from features import Loader
 
 
@@ -8,11 +9,16 @@ class Perceptron:
         self.W = None
     
     def train(self, X, Y, MAXITER=1000, lr=0.01):
+        '''
+        Args:
+            X: ndarray or scipy.sparse matrix with shape (#samples, #features)
+            Y: ndarray of class ids with shape (#samples,)
+        '''
         # set weights with padding
-        self.W = np.zeros((X.shape[1] + 1, Y.shape[0]))
+        self.W = np.zeros((X.shape[1] + 1, np.max(Y) + 1))
 
-        # pad ones to inputs
-        X = np.hstack((np.ones((X.shape[0], 1)), X))
+        # pad ones to inputs, and keep them sparse so each step only touches the nonzero features
+        X = sparse.hstack((np.ones((X.shape[0], 1)), sparse.csr_matrix(X)), format='csr')
 
         # run training
         for i in range(MAXITER):
@@ -20,14 +26,16 @@ class Perceptron:
             if idx % 500 == 0:
                 print('Epoch: {}, Step: {}'.format(i // X.shape[0] + 1, idx))
 
-            y_ = np.argmax(np.dot(X[idx], self.W))
+            cols = X.indices[X.indptr[idx]:X.indptr[idx + 1]]
+            vals = X.data[X.indptr[idx]:X.indptr[idx + 1]]
+            y_ = np.argmax(np.dot(vals, self.W[cols]))
             if y_ != Y[idx]:
-                self.W[:, y_] -= lr * X[idx]
-                self.W[:, Y[idx]] += lr * X[idx]
+                self.W[cols, y_] -= lr * vals
+                self.W[cols, Y[idx]] += lr * vals
 
     def predict(self, X_test):
-        X_test = np.hstack((np.ones((X_dev.shape[0], 1)), X_test))
-        Y_ = np.argmax(np.dot(X_test, self.W), axis=1)
+        X_test = sparse.hstack((np.ones((X_test.shape[0], 1)), sparse.csr_matrix(X_test)), format='csr')
+        Y_ = np.argmax(X_test @ self.W, axis=1)
         return Y_
 
     def score(self, X_dev, Y_dev):
@@ -45,7 +53,7 @@ def generate_submission(Y_pred, class_dict, filename='submission'):
 
 if __name__ == '__main__':
     loader = Loader('newsgroups')
-    X_train, Y_train, X_dev, Y_dev, Y_test = loader.bow()
+    X_train, Y_train, X_dev, Y_dev, X_test = loader.bow()
     print('Done loading data.')
 
     perceptron = Perceptron()
@@ -54,6 +62,6 @@ if __name__ == '__main__':
     acc = perceptron.score(X_dev[:, :10000], Y_dev)
     print('Dev set accuracy:', acc)
 
-    Y_pred = perceptron.predict(X_test)
+    Y_pred = perceptron.predict(X_test[:, :10000])
     generate_submission(Y_pred, loader.class_dict, 'test')
 
@@ -1,26 +1,37 @@
 #!/usr/bin/env python3
 import numpy as np
 import csv
+import os
 from nltk.util import ngrams
 from nltk.tokenize import word_tokenize
 from nltk.stem.wordnet import WordNetLemmatizer
 from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from feature_cache import cached
+
 csv.field_size_limit(sys.maxsize)
 lemmatizer = WordNetLemmatizer()
 
 
 class Loader:
-    def __init__(self, dataset):
+    def __init__(self, dataset, cache=True):
+        '''
+        Args:
+            dataset: str, 'propernames'
+            cache: bool, load features from the feature_cache when computed before
+        '''
         if dataset == 'propernames':
             self.data_path = '../data/propernames/'
         else:
             raise ValueError('Not a valid dataset.')
+        self.cache = cache
         self.vocab_x = None
         self.vocab_y = None
         self.class_dict = None
 
+    @cached
     def char_ngram(self, ngram_range=(2, 2), dim_used=None):
         texts_train, Y_train = self._load_data('train')
         texts_dev, Y_dev = self._load_data('dev')
@@ -32,6 +43,7 @@ class Loader:
         self.vocab_x = vectorizer.vocabulary_
         return X_train, Y_train, X_dev, Y_dev, X_test
     
+    @cached
     def char_ngram_(self, n=2):
         '''
         Character n-grams for propernames classification.
@@ -16,52 +16,49 @@ class MaxEnt:
         self.num_classes = max(Y) + 1
         self.W = np.zeros(self.block_size * self.num_classes)
         
-        # start optimization
+        # start optimization, loss and gradient come from one pass over X
         self.W, loss, info = opt.fmin_l_bfgs_b(
-            self._log_likelihood, 
+            self._loss_grad, 
             x0=self.W,
-            args=(X, Y, lmda), 
-            fprime=self._log_likelihood_grad, 
-            approx_grad=False,
+            args=(X, self._onehot_encode(Y), lmda), 
             iprint=1)
 
-    def _log_likelihood(self, para, *args):
-        X, Y, lmda = args
-        W = para
-        W_ = W.reshape(self.num_classes, self.block_size)
-        probs = self._softmax(np.dot(X, W_.T))
-        L = np.sum(np.log([probs[i][Y[i]] for i in range(self.N)])) 
+    def _loss_grad(self, para, *args):
+        '''
+        Negative L2-regularized log likelihood and its gradient, from a single forward pass.
+        Args:
+            para: ndarray with shape (num_classes * block_size,), flattened weights
+            args: X, Y_onehot with shape (#samples, num_classes), lmda
+        Returns:
+            loss: float
+            grad: ndarray with the shape of para
+        '''
+        X, Y_onehot, lmda = args
+        W_ = para.reshape(self.num_classes, self.block_size)
+        log_probs = self._log_softmax(X @ W_.T) # a sparse X is multiplied without densifying
+        L = np.sum(log_probs * Y_onehot)
         L -= 0.5 * lmda * np.sum(W_ ** 2) # regularization
-        return -L
-
-    def _log_likelihood_grad(self, para, *args):
-        X, Y, lmda = args
-        W = para
-        W_ = W.reshape(self.num_classes, self.block_size)
-        dL = np.zeros_like(W_)
-        probs = self._softmax(np.dot(X, W_.T))
-        
-        for i in range(self.num_classes):
-            dL[i] += np.sum(X[Y == i], axis=0) - np.sum(X * probs[:, i].reshape(-1, 1), axis=0)
+        dL = (X.T @ (Y_onehot - np.exp(log_probs))).T # (onehot(Y) - probs).T @ X
         dL -= lmda * W_ # regularization
-        return -dL.flatten()
+        return -L, -np.ravel(dL)
 
-    def _softmax(self, M):
+    def _log_softmax(self, M):
         '''
-        Calculate softmax.
+        Calculate log softmax.
         Args:
             M: Each row contains an inner products vector for all classes (#smaple, num_classes)
                The softmax will be applied on the rows.
         Returns:
-            M: The probability score matrix (along rows)
+            M: The log probability score matrix (along rows)
         '''
-        if M.ndim > 1:
-            M -= np.max(M, axis=1).reshape(M.shape[0], 1)
-            M = np.exp(M) / np.sum(np.exp(M), axis=1).reshape(M.shape[0], 1)
-        else:
-            M -= np.max(M)
-            M = np.exp(M) / np.sum(np.exp(M))
-        return M
+        M = M - np.max(M, axis=1, keepdims=True)
+        return M - np.log(np.sum(np.exp(M), axis=1, keepdims=True))
+
+    def _onehot_encode(self, Y):
+        '''Convert label vector Y into one-hot encoded form.'''
+        Y_onehot = np.zeros((len(Y), self.num_classes))
+        Y_onehot[np.arange(len(Y)), Y] = 1
+        return Y_onehot
 
     def predict(self, X_test):
         W_ = self.W.reshape(self.num_classes, self.block_size)
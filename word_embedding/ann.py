@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+import numpy as np
+import time
+from argparse import ArgumentParser
+from embedding_io import load_embeddings
+from query import QueryEngine, _top_k
+
+
+def _normalize(matrix, chunk_size=50000):
+    '''
+    Return a float32 copy of matrix with unit rows, normalized chunk_size rows at a time.
+    '''
+    normalized = np.zeros(matrix.shape, dtype=np.float32)
+    for start in range(0, len(matrix), chunk_size):
+        chunk = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+        norms = np.linalg.norm(chunk, axis=1, keepdims=True)
+        normalized[start:start + len(chunk)] = chunk / np.maximum(norms, 1e-12)
+    return normalized
+
+
+def _assign(vectors, centroids, chunk_size=50000):
+    '''
+    Return the id of the most similar centroid of each vector.
+    '''
+    return np.concatenate([np.argmax(vectors[i:i + chunk_size] @ centroids.T, axis=1)
+                           for i in range(0, len(vectors), chunk_size)])
+
+
+def _inverse(ids):
+    '''
+    Return the inverse permutation of ids, i.e. the row of the grouped vectors holding each embedding row.
+    '''
+    positions = np.empty(len(ids), dtype=np.int64)
+    positions[ids] = np.arange(len(ids))
+    return positions
+
+
+class IVFIndex:
+    def __init__(self, embeddings, num_lists=None, iterations=10, sample_size=100000, nprobe=8):
+        '''
+        Approximate cosine nearest neighbour index over an embedding table (IVF).
+        Rows are clustered by spherical k-means into num_lists inverted lists; a query
+        is scored exactly against the rows of its nprobe most similar lists only.
+        The normalized rows are stored grouped by list, so each probed list is one
+        contiguous slice and a query costs a few small matrix multiplies.
+        Args:
+            embeddings: embedding_io.Embeddings, e.g. from Word2Vec.export_embeddings
+            num_lists: int, number of inverted lists, 4 * sqrt(#words) by default
+            iterations: int, number of k-means iterations
+            sample_size: int, number of rows k-means is trained on
+            nprobe: int, default number of lists scanned per query
+        '''
+        self.embeddings = embeddings
+        self.nprobe = nprobe
+        if embeddings is None:
+            return # filled in by load
+        vectors = _normalize(embeddings.matrix)
+        num_lists = min(num_lists or int(4 * np.sqrt(len(vectors))), len(vectors))
+
+        # spherical k-means on a sample of the rows
+        sample = vectors[np.random.choice(len(vectors), min(sample_size, len(vectors)), replace=False)]
+        centroids = sample[np.random.choice(len(sample), num_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = _assign(sample, centroids)
+            sums = np.zeros(centroids.shape, dtype=np.float32)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=num_lists) == 0
+            # restart empty lists from random rows
+            sums[empty] = sample[np.random.choice(len(sample), empty.sum())]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        assignments = _assign(vectors, centroids)
+        self.centroids = centroids
+        self.ids = np.argsort(assignments, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=num_lists))])
+        self.vectors = vectors[self.ids]
+        self.positions = _inverse(self.ids)
+
+    def save(self, path):
+        '''
+        Save the index as path.ivf.npz, next to the embeddings it was built from.
+        '''
+        np.savez(path + '.ivf.npz', centroids=self.centroids, ids=self.ids,
+                 offsets=self.offsets, vectors=self.vectors)
+
+    @classmethod
+    def load(cls, path, embeddings=None, nprobe=8):
+        '''
+        Load an index written by save.
+        Args:
+            path: str, path given to save
+            embeddings: embedding_io.Embeddings, needed for word queries, loaded from path by default
+        Returns:
+            index: IVFIndex
+        '''
+        index = cls(None, nprobe=nprobe)
+        index.embeddings = embeddings if embeddings is not None else load_embeddings(path)
+        with np.load(path + '.ivf.npz') as f:
+            index.centroids = f['centroids']
+            index.ids = f['ids']
+            index.offsets = f['offsets']
+            index.vectors = f['vectors']
+        index.positions = _inverse(index.ids)
+        return index
+
+    def nearest(self, words, k=10, nprobe=None):
+        '''
+        Return the approximate k nearest neighbours of each word, the word itself excluded.
+        Returns:
+            neighbours: List[List[(str, float)]], most similar first
+        '''
+        word_ids = self.embeddings.word_ids
+        missing = [word for word in words if word not in word_ids]
+        if missing:
+            raise KeyError('Words not in embeddings: {}'.format(', '.join(missing)))
+        ids = np.array([word_ids[word] for word in words], dtype=np.int64)
+        ids, scores = self.search(self.vectors[self.positions[ids]], k, nprobe, exclude=ids[:, np.newaxis])
+        return [[(self.embeddings.words[i], float(s)) for i, s in zip(row_ids, row_scores) if i >= 0]
+                for row_ids, row_scores in zip(ids, scores)]
+
+    def search(self, queries, k=10, nprobe=None, exclude=None):
+        '''
+        Approximate top-k search by cosine similarity, with the same arguments and
+        results as QueryEngine.search. Queries whose probed lists hold fewer than k
+        rows are padded with id -1 and score -inf.
+        Args:
+            nprobe: int, number of lists scanned per query, self.nprobe by default
+        '''
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        queries = np.asarray(queries, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        probes = _top_k(queries @ self.centroids.T, nprobe)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            candidate_ids = self.ids[rows]
+            candidate_scores = self.vectors[rows] @ query
+            if exclude is not None:
+                candidate_scores[np.isin(candidate_ids, exclude[i])] = -np.inf
+            top = _top_k(candidate_scores[np.newaxis], k)[0]
+            top = top[np.argsort(-candidate_scores[top], kind='stable')]
+            ids[i, :len(top)] = candidate_ids[top]
+            scores[i, :len(top)] = candidate_scores[top]
+        ids[scores == -np.inf] = -1
+        return ids, scores
+
+
+def benchmark(index, engine, num_queries=1000, k=10, nprobes=(1, 2, 4, 8, 16, 32)):
+    '''
+    Print recall@k and latency of index against exact search by engine, for each
+    nprobe, on the vectors of num_queries random words.
+    '''
+    words = list(np.random.choice(engine.embeddings.words, num_queries, replace=False))
+    queries = engine.vectors(words)
+    exclude = engine.ids(words)[:, np.newaxis]
+    start = time.time()
+    exact_ids, _ = engine.search(queries, k, exclude=exclude)
+    print('exact: {:.3f} ms/query batched'.format((time.time() - start) * 1000 / num_queries))
+    start = time.time()
+    for i in range(min(num_queries, 100)):
+        engine.search(queries[i:i + 1], k, exclude=exclude[i:i + 1])
+    print('exact: {:.3f} ms/query one at a time'.format((time.time() - start) * 1000 / min(num_queries, 100)))
+    for nprobe in nprobes:
+        start = time.time()
+        approx_ids = [index.search(queries[i:i + 1], k, nprobe, exclude=exclude[i:i + 1])[0][0]
+                      for i in range(num_queries)]
+        ms = (time.time() - start) * 1000 / num_queries
+        recall = np.mean([len(np.intersect1d(a, b)) / k for a, b in zip(approx_ids, exact_ids)])
+        print('nprobe {:3d}: recall@{} {:.3f}, {:.3f} ms/query one at a time'.format(nprobe, k, recall, ms))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('embedding', help='embedding path written by embedding_io.save_embeddings')
+    parser.add_argument('-l', '--lists', dest='lists', type=int,
+                        help='number of inverted lists, 4 * sqrt(#words) by default')
+    parser.add_argument('-n', '--nearest', dest='nearest', nargs='+', default=[],
+                        help='print approximate nearest neighbours of these words')
+    parser.add_argument('-k', dest='k', type=int, default=10,
+                        help='number of neighbours')
+    parser.add_argument('--nprobe', dest='nprobe', type=int, default=8,
+                        help='number of lists scanned per query')
+    parser.add_argument('-b', '--benchmark', dest='benchmark', type=int, default=0,
+                        help='compare recall and latency with exact search on this many random words')
+    args = parser.parse_args()
+
+    path = args.embedding[:-len('.npy')] if args.embedding.endswith('.npy') else args.embedding
+    embeddings = load_embeddings(path)
+    try:
+        index = IVFIndex.load(path, embeddings, nprobe=args.nprobe)
+        print('Loaded index with {} lists.'.format(len(index.centroids)))
+    except FileNotFoundError:
+        start = time.time()
+        index = IVFIndex(embeddings, num_lists=args.lists, nprobe=args.nprobe)
+        index.save(path)
+        print('Built index with {} lists in {:.1f} sec.'.format(len(index.centroids), time.time() - start))
+    for word, neighbours in zip(args.nearest, index.nearest(args.nearest, args.k)):
+        print('{}: {}'.format(word, ' '.join('{}({:.3f})'.format(w, s) for w, s in neighbours)))
+    if args.benchmark:
+        benchmark(index, QueryEngine(embeddings), args.benchmark, args.k)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import numpy as np
+from argparse import ArgumentParser
+
+
+class Embeddings:
+    def __init__(self, words, matrix):
+        '''
+        Word embeddings with dict-like lookup, e.g. `word in emb` and `emb[word]`.
+        Args:
+            words: List[str], word of each row
+            matrix: ndarray with shape (#words, dim), possibly a read-only memmap
+        '''
+        self.words = words
+        self.word_ids = {word: i for i, word in enumerate(words)}
+        self.matrix = matrix
+        self.dim = matrix.shape[1]
+
+    def __contains__(self, word):
+        return word in self.word_ids
+
+    def __getitem__(self, word):
+        return self.matrix[self.word_ids[word]]
+
+    def __len__(self):
+        return len(self.words)
+
+
+def save_embeddings(path, words, matrix):
+    '''
+    Save embeddings as path.npy, a float32 matrix, and path.vocab, the word of each row.
+    '''
+    np.save(path + '.npy', np.asarray(matrix, dtype=np.float32))
+    with open(path + '.vocab', 'w') as f:
+        for word in words:
+            f.write(word + '\n')
+
+
+def load_embeddings(path, mmap_mode='r'):
+    '''
+    Load embeddings written by save_embeddings. The matrix is memory-mapped by
+    default, so loading only reads the vocabulary and rows are paged in on use.
+    Args:
+        path: str, path without extension, or the .npy file
+        mmap_mode: str or None, passed to np.load, None reads the matrix into memory
+    Returns:
+        embeddings: Embeddings
+    '''
+    if path.endswith('.npy'):
+        path = path[:-len('.npy')]
+    with open(path + '.vocab') as f:
+        words = [line.rstrip('\n') for line in f]
+    return Embeddings(words, np.load(path + '.npy', mmap_mode=mmap_mode))
+
+
+def write_text_embeddings(path, words, matrix):
+    '''
+    Write the text format read by scripts/similarity.py: one line per word,
+    the word followed by its embedding.
+    '''
+    with open(path, 'w') as f:
+        for word, embed_vec in zip(words, matrix):
+            f.write('{} {} \n'.format(word, ' '.join(map(str, embed_vec))))
+
+
+def convert_text_embeddings(text_path, path):
+    '''
+    Convert a text embedding file (e.g. embeddings.txt or GloVe) to the binary format.
+    '''
+    words = []
+    rows = []
+    with open(text_path) as f:
+        for line in f:
+            word, *vector = line.split()
+            words.append(word)
+            rows.append(np.array(vector, dtype=np.float32))
+    save_embeddings(path, words, np.vstack(rows))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('text_path', help='text embedding file to convert')
+    parser.add_argument('path', help='output path without extension, .npy and .vocab are added')
+    args = parser.parse_args()
+    convert_text_embeddings(args.text_path, args.path)
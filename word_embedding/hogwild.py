@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+import numpy as np
+import multiprocessing
+import time
+from argparse import ArgumentParser
+from loader import Loader
+from skipgram import SkipGram
+
+
+def _scatter_add(matrix, ids, updates):
+    '''
+    matrix[ids] += updates where repeated ids accumulate their updates, by summing
+    the updates of each id with sort and reduceat (much faster than np.add.at).
+    '''
+    order = np.argsort(ids, kind='stable')
+    ids = ids[order]
+    starts = np.flatnonzero(np.concatenate([[True], ids[1:] != ids[:-1]]))
+    matrix[ids[starts]] += np.add.reduceat(updates[order], starts, axis=0)
+
+
+class HogwildWord2Vec(SkipGram):
+    def __init__(self, vocab, rev_vocab, counts, batch_size=128, embed_size=100, num_sampled=5,
+                 full_window_size=3, num_steps=None, dynamic_window=False, subsample=None,
+                 learning_rate=0.025, workers=None):
+        '''
+        Skip-gram with negative sampling trained by SGD in several processes at once.
+        Embedding and output matrices live in shared memory and every worker updates
+        them without locks (Hogwild), each on its own shard of the text.
+        Args:
+            counts: dict, word to count mapping, for the unigram^0.75 negative samples
+            num_sampled: int, negative samples per (center, context) pair
+            num_steps: int, number of batches over all workers
+            subsample: float, threshold of frequent-word subsampling, None to keep all words
+            learning_rate: float, initial SGD learning rate, decayed linearly to 0.01% of it
+            workers: int, number of worker processes, all cores by default
+        '''
+        self.vocab = vocab
+        self.rev_vocab = rev_vocab
+        self.batch_size = batch_size
+        self.vocab_size = len(vocab)
+        self.embed_size = embed_size
+        self.num_sampled = num_sampled
+        self.full_window_size = full_window_size
+        self.dynamic_window = dynamic_window
+        self.num_steps = num_steps
+        if num_steps is None:
+            raise ValueError('Number of steps should be specified.')
+        self.learning_rate = learning_rate
+        self.workers = workers or multiprocessing.cpu_count()
+        self._init_sampling(counts, subsample, True)
+
+        # shared float32 matrices, initialized as in word2vec
+        self._shared_embeddings = multiprocessing.RawArray('f', self.vocab_size * embed_size)
+        self._shared_W = multiprocessing.RawArray('f', self.vocab_size * embed_size)
+        self.embeddings = np.frombuffer(self._shared_embeddings, dtype=np.float32).reshape(self.vocab_size, embed_size)
+        self.W = np.frombuffer(self._shared_W, dtype=np.float32).reshape(self.vocab_size, embed_size)
+        self.embeddings[:] = (np.random.random_sample(self.embeddings.shape) - 0.5) / embed_size
+
+    def train(self, data, log_every=10):
+        '''
+        Shard the text into one contiguous part per worker and train in forked
+        processes, which share the matrices and the (possibly memory-mapped) text.
+        Args:
+            data: ndarray, the whole text data as word ids
+            log_every: float, seconds between progress logs
+        '''
+        termination = int(self._termination(data))
+        half_window = int(self.full_window_size / 2)
+        bounds = np.linspace(0, termination, self.workers + 1).astype(np.int64)
+        # batches expected after subsampling and dynamic windows drop pairs, so that
+        # the linear learning rate decay reaches its floor by the end of training
+        total_steps = (termination - 2 * half_window) / self.idx_hop * self.keep_fraction
+        if self.dynamic_window:
+            total_steps *= (half_window + 1) / (2 * half_window)
+        # progress[i] = [batches done, summed loss of the last log interval] of worker i
+        self._progress = np.frombuffer(multiprocessing.RawArray('d', 2 * self.workers)).reshape(self.workers, 2)
+
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=self._work,
+                                     args=(data[bounds[i]:min(bounds[i + 1] + 2 * half_window, len(data))],
+                                           i, total_steps))
+                     for i in range(self.workers)]
+        start = time.time()
+        for process in processes:
+            process.start()
+        log_time = start
+        log_steps = 0
+        while any(process.is_alive() for process in processes):
+            time.sleep(0.1)
+            if time.time() - log_time < log_every:
+                continue
+            steps = int(self._progress[:, 0].sum())
+            loss = self._progress[:, 1].sum()
+            self._progress[:, 1] = 0
+            print('Step {}, Average Loss: {:.6f}, {:.0f} words/sec'.format(
+                steps, loss / max(steps - log_steps, 1), (steps - log_steps) * self.idx_hop / (time.time() - log_time)))
+            log_time = time.time()
+            log_steps = steps
+        for process in processes:
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError('Worker process exited with code {}.'.format(process.exitcode))
+        secs = time.time() - start
+        steps = int(self._progress[:, 0].sum())
+        print('Trained {} steps in {:.1f} sec, {:.0f} words/sec.'.format(steps, secs, steps * self.idx_hop / secs))
+
+    def _work(self, shard, worker, total_steps):
+        '''
+        Train on one shard. Runs in a forked worker process.
+        '''
+        np.random.seed((int(time.time()) + worker) % 2 ** 32) # forked workers inherit the same random state
+        progress = self._progress[worker]
+        for centers, contexts, negatives in self._extract_batch(shard, len(shard)):
+            # learning rate decays with the progress of all workers
+            done = self._progress[:, 0].sum() / total_steps
+            learning_rate = self.learning_rate * max(1 - done, 1e-4)
+            loss = self._sgd_step(centers, contexts[:, 0], negatives, learning_rate)
+            # the parent resets the loss sum, so add only after the step
+            progress[1] += loss
+            progress[0] += 1
+
+    def _sgd_step(self, centers, contexts, negatives, learning_rate):
+        '''
+        One SGD step of negative sampling on a batch of pairs, maximizing
+        log sigmoid(u_o . v_c) + sum_k log sigmoid(-u_k . v_c).
+        Returns:
+            loss: float, average negative log likelihood of the batch before the update
+        '''
+        v = self.embeddings[centers]                         # (batch, embed)
+        targets = np.concatenate([contexts[:, np.newaxis], negatives], axis=1)
+        u = self.W[targets]                                  # (batch, 1 + num sampled, embed)
+        labels = np.zeros(targets.shape, dtype=np.float32)
+        labels[:, 0] = 1
+        scores = 1 / (1 + np.exp(-np.einsum('bd,bkd->bk', v, u)))
+        grads = (labels - scores) * learning_rate             # gradient of the log likelihood wrt the logits
+        loss = -np.mean(np.log(np.where(labels > 0, scores, 1 - scores) + 1e-7).sum(axis=1))
+        _scatter_add(self.embeddings, centers, np.einsum('bk,bkd->bd', grads, u))
+        _scatter_add(self.W, targets.ravel(), (grads[:, :, np.newaxis] * v[:, np.newaxis, :]).reshape(-1, self.embed_size))
+        return loss
+
+    def export_embeddings(self, path='embeddings', text=True):
+        '''
+        Export the whole normalized embedding table like Word2Vec.export_embeddings.
+        '''
+        id_to_embedding = self.embeddings / np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+        print('Final embedding shape: ', id_to_embedding.shape)
+        self._write_embeddings(id_to_embedding, path, text)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-d', '--dataset', dest='dataset', default='data3m',
+                        help='training file in ./data/training')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('-s', '--steps', dest='steps', type=int, default=500000,
+                        help='number of batches over all workers')
+    args = parser.parse_args()
+
+    start = time.time()
+    loader = Loader()
+    if not loader.has_preprocessed(args.dataset):
+        loader.preprocess(args.dataset)
+    data, vocab, rev_vocab, counts, stems = loader.load_mmap(args.dataset)
+    print('Done loading data.')
+    print('Data size:', len(data))
+    print('Vocabulary size:', len(vocab))
+
+    w2v = HogwildWord2Vec(vocab, rev_vocab, counts, embed_size=50, full_window_size=3,
+                          num_steps=args.steps, subsample=1e-5, workers=args.workers)
+    w2v.train(data)
+    w2v.export_embeddings()
+
+    print('Time used: {} min'.format(int((time.time() - start) / 60)))
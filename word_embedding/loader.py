@@ -1,8 +1,10 @@
 import numpy as np
+import os
 from nltk.stem.porter import PorterStemmer
 from collections import Counter
+from stem_cache import StemCache
 
-stemmer = PorterStemmer()
+stemmer = StemCache('porter', PorterStemmer().stem)
 
 
 class Loader:
@@ -14,10 +16,8 @@ class Loader:
 
     def load_data(self, dataset):
         text_word = []
-        text_id = []
         vocab = {}
         rev_vocab = {}
-        stems = {}
         # go through the whole data
         with open(self.train_path + dataset, 'r') as f:
             for line in f:
@@ -25,16 +25,65 @@ class Loader:
                 for word in line:
                     text_word.append(word)
         # build vocabulary starting from the lowest index/most common word
-        for i, pair in enumerate(Counter(text_word).most_common()):
-            word, _ = pair
+        counts = dict(Counter(text_word).most_common())
+        for i, word in enumerate(counts):
             vocab[word] = i
             rev_vocab[i] = word
-            stems[stemmer.stem(word)] = word # stemmed word to word mapping
-        for word in text_word:
-            text_id.append(vocab[word])
-        counts = dict(Counter(text_word).most_common())
+        stems = stemmer.stems(counts) # stemmed word to word mapping, cached by vocabulary
+        text_id = np.array([vocab[word] for word in text_word], dtype=np.int32)
+        return text_id, vocab, rev_vocab, counts, stems
+
+    def preprocess(self, dataset, chunk_size=1000000):
+        '''
+        One-time conversion of a training file into <dataset>.vocab, one "word count"
+        line per word id (most common first, as in load_data), and <dataset>.ids, the
+        flat uint32 word ids of the text. Both passes stream the file, so memory is
+        bounded by the vocabulary and chunk_size.
+        Args:
+            dataset: str, file name in the training directory
+            chunk_size: int, number of word ids written at a time
+        '''
+        counts = Counter()
+        with open(self.train_path + dataset, 'r') as f:
+            for line in f:
+                counts.update(line.split())
+        vocab = {}
+        with open(self.train_path + dataset + '.vocab', 'w') as f:
+            for i, (word, count) in enumerate(counts.most_common()):
+                vocab[word] = i
+                f.write('{} {}\n'.format(word, count))
+        with open(self.train_path + dataset, 'r') as f, open(self.train_path + dataset + '.ids', 'wb') as f_ids:
+            ids = []
+            for line in f:
+                ids.extend(vocab[word] for word in line.split())
+                if len(ids) >= chunk_size:
+                    np.array(ids, dtype=np.uint32).tofile(f_ids)
+                    ids = []
+            np.array(ids, dtype=np.uint32).tofile(f_ids)
+
+    def load_mmap(self, dataset):
+        '''
+        Load a dataset written by preprocess(). Word ids are memory-mapped instead
+        of read, so loading takes time and memory proportional to the vocabulary only.
+        Returns the same values as load_data, with word ids as a read-only uint32 memmap.
+        '''
+        vocab = {}
+        rev_vocab = {}
+        counts = {}
+        with open(self.train_path + dataset + '.vocab', 'r') as f:
+            for i, line in enumerate(f):
+                word, count = line.split()
+                vocab[word] = i
+                rev_vocab[i] = word
+                counts[word] = int(count)
+        stems = stemmer.stems(counts)
+        text_id = np.memmap(self.train_path + dataset + '.ids', dtype=np.uint32, mode='r')
         return text_id, vocab, rev_vocab, counts, stems
 
+    def has_preprocessed(self, dataset):
+        return (os.path.exists(self.train_path + dataset + '.vocab')
+                and os.path.exists(self.train_path + dataset + '.ids'))
+
     def load_eval(self):
         word_pairs = []
         with open(self.dev_x_path) as fx:
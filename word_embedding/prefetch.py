@@ -0,0 +1,58 @@
+import queue
+import threading
+
+
+class _Done:
+    '''
+    Marks the end of one producer. Carries the exception that stopped it, if any.
+    '''
+    def __init__(self, error=None):
+        self.error = error
+
+
+class Prefetcher:
+    def __init__(self, producers, capacity=100):
+        '''
+        Run each producer (an iterable of batches) in a background thread that
+        fills a bounded queue, so batches are ready before the consumer asks for them.
+        Args:
+            producers: list of iterables, each consumed by its own thread
+            capacity: int, maximum number of batches waiting in the queue
+        '''
+        self.capacity = capacity
+        self.queue = queue.Queue(maxsize=capacity)
+        self.num_producers = len(producers)
+        self.threads = [threading.Thread(target=self._produce, args=(producer,), daemon=True)
+                        for producer in producers]
+        for thread in self.threads:
+            thread.start()
+
+    def _produce(self, producer):
+        try:
+            for batch in producer:
+                self.queue.put(batch)
+        except Exception as e:
+            self.queue.put(_Done(e))
+        else:
+            self.queue.put(_Done())
+
+    def __iter__(self):
+        '''
+        Yield batches until every producer is exhausted. Batches of different
+        producers are interleaved in the order they were produced.
+        '''
+        num_done = 0
+        while num_done < self.num_producers:
+            batch = self.queue.get()
+            if isinstance(batch, _Done):
+                if batch.error is not None:
+                    raise batch.error
+                num_done += 1
+                continue
+            yield batch
+
+    def occupancy(self):
+        '''
+        Return the number of batches currently waiting in the queue.
+        '''
+        return self.queue.qsize()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import numpy as np
+import time
+from argparse import ArgumentParser
+from embedding_io import load_embeddings
+
+
+class QueryEngine:
+    def __init__(self, embeddings, chunk_size=50000, query_chunk_size=1024):
+        '''
+        Cosine similarity, nearest neighbour and analogy queries over an embedding table.
+        The table is scanned chunk_size rows at a time and queries are answered
+        query_chunk_size at a time, so a memory-mapped table is never copied whole
+        and score matrices stay small.
+        Args:
+            embeddings: embedding_io.Embeddings
+            chunk_size: int, number of table rows scored at a time
+            query_chunk_size: int, number of queries scored at a time
+        '''
+        self.embeddings = embeddings
+        self.chunk_size = chunk_size
+        self.query_chunk_size = query_chunk_size
+        self.norms = np.concatenate([np.linalg.norm(embeddings.matrix[i:i + chunk_size], axis=1)
+                                     for i in range(0, len(embeddings), chunk_size)])
+        self.norms[self.norms == 0] = 1
+
+    def ids(self, words):
+        '''
+        Return row ids of words, raising KeyError for words not in the table.
+        '''
+        word_ids = self.embeddings.word_ids
+        missing = [word for word in words if word not in word_ids]
+        if missing:
+            raise KeyError('Words not in embeddings: {}'.format(', '.join(missing)))
+        return np.array([word_ids[word] for word in words], dtype=np.int64)
+
+    def vectors(self, words):
+        '''
+        Return normalized vectors of words with shape (#words, dim).
+        '''
+        ids = self.ids(words)
+        return self.embeddings.matrix[ids] / self.norms[ids, np.newaxis]
+
+    def similarity(self, words1, words2):
+        '''
+        Return cosine similarities of the word pairs (words1[i], words2[i]).
+        '''
+        return np.einsum('ij,ij->i', self.vectors(words1), self.vectors(words2))
+
+    def nearest(self, words, k=10):
+        '''
+        Return the k nearest neighbours of each word, the word itself excluded.
+        Returns:
+            neighbours: List[List[(str, float)]], most similar first
+        '''
+        ids = self.ids(words)
+        return self._to_words(*self.search(self.vectors(words), k, exclude=ids[:, np.newaxis]))
+
+    def analogy(self, a, b, c, k=1):
+        '''
+        Answer "a is to b as c is to ?" for lists of words with 3CosAdd, i.e. the
+        nearest neighbours of b - a + c, excluding a, b and c.
+        Returns:
+            answers: List[List[(str, float)]], most similar first
+        '''
+        queries = self.vectors(b) - self.vectors(a) + self.vectors(c)
+        exclude = np.stack([self.ids(a), self.ids(b), self.ids(c)], axis=1)
+        return self._to_words(*self.search(queries, k, exclude=exclude))
+
+    def search(self, queries, k=10, exclude=None):
+        '''
+        Exact top-k search by cosine similarity: a matrix multiply per block of
+        queries and table rows, keeping the best k of each block with argpartition.
+        Args:
+            queries: ndarray with shape (#queries, dim)
+            k: int, number of neighbours
+            exclude: ndarray with shape (#queries, m), row ids never returned for each query
+        Returns:
+            ids: ndarray with shape (#queries, k), row ids, most similar first
+            scores: ndarray with shape (#queries, k), cosine similarities
+        '''
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        ids = np.zeros((len(queries), k), dtype=np.int64)
+        scores = np.zeros((len(queries), k), dtype=np.float32)
+        for q in range(0, len(queries), self.query_chunk_size):
+            block = queries[q:q + self.query_chunk_size].astype(np.float32)
+            best_ids = np.zeros((len(block), 0), dtype=np.int64)
+            best_scores = np.zeros((len(block), 0), dtype=np.float32)
+            for start in range(0, len(self.embeddings), self.chunk_size):
+                chunk = self.embeddings.matrix[start:start + self.chunk_size]
+                chunk_scores = block @ chunk.T / self.norms[start:start + len(chunk)].astype(np.float32)
+                if exclude is not None:
+                    rows, cols = np.nonzero((exclude[q:q + len(block)] >= start) & (exclude[q:q + len(block)] < start + len(chunk)))
+                    chunk_scores[rows, exclude[q + rows, cols] - start] = -np.inf
+                # merge the best k of this chunk with the best k so far
+                top = _top_k(chunk_scores, k)
+                best_ids = np.concatenate([best_ids, top + start], axis=1)
+                best_scores = np.concatenate([best_scores, np.take_along_axis(chunk_scores, top, axis=1)], axis=1)
+                top = _top_k(best_scores, k)
+                best_ids = np.take_along_axis(best_ids, top, axis=1)
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            ids[q:q + len(block)] = np.take_along_axis(best_ids, order, axis=1)
+            scores[q:q + len(block)] = np.take_along_axis(best_scores, order, axis=1)
+        return ids, scores
+
+    def _to_words(self, ids, scores):
+        words = self.embeddings.words
+        return [[(words[i], float(s)) for i, s in zip(row_ids, row_scores)]
+                for row_ids, row_scores in zip(ids, scores)]
+
+
+def _top_k(scores, k):
+    '''
+    Return column indices of the k largest scores of each row, in no particular order.
+    '''
+    if scores.shape[1] <= k:
+        return np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+    return np.argpartition(scores, -k, axis=1)[:, -k:]
+
+
+def read_pairs(path):
+    '''
+    Read word pairs from a csv file with columns id,word1,word2 e.g. scripts/similarity/dev_x.csv.
+    '''
+    pairs = []
+    with open(path) as f:
+        next(f)
+        for line in f:
+            pairs.append(line.strip().split(',')[1:])
+    return pairs
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('embedding', help='embedding path written by embedding_io.save_embeddings')
+    parser.add_argument('-n', '--nearest', dest='nearest', nargs='+', default=[],
+                        help='print nearest neighbours of these words')
+    parser.add_argument('-a', '--analogy', dest='analogy', nargs=3, action='append', default=[],
+                        metavar=('A', 'B', 'C'), help='print answers of "A is to B as C is to ?"')
+    parser.add_argument('-p', '--pairs', dest='pairs',
+                        help='csv of word pairs, prints id,similarity for each pair')
+    parser.add_argument('-k', dest='k', type=int, default=10,
+                        help='number of neighbours')
+    parser.add_argument('-b', '--benchmark', dest='benchmark', type=int, default=0,
+                        help='time nearest neighbour queries of this many random words')
+    args = parser.parse_args()
+
+    engine = QueryEngine(load_embeddings(args.embedding))
+    for word, neighbours in zip(args.nearest, engine.nearest(args.nearest, args.k)):
+        print('{}: {}'.format(word, ' '.join('{}({:.3f})'.format(w, s) for w, s in neighbours)))
+    for (a, b, c), answers in zip(args.analogy, engine.analogy(*zip(*args.analogy), k=args.k) if args.analogy else []):
+        print('{} : {} = {} : {}'.format(a, b, c, ' '.join('{}({:.3f})'.format(w, s) for w, s in answers)))
+    if args.pairs:
+        pairs = read_pairs(args.pairs)
+        print('id,similarity')
+        for i, similarity in enumerate(engine.similarity(*zip(*pairs))):
+            print('{},{}'.format(i, similarity))
+    if args.benchmark:
+        words = list(np.random.choice(engine.embeddings.words, args.benchmark))
+        start = time.time()
+        engine.nearest(words, args.k)
+        secs = time.time() - start
+        print('{} queries in {:.2f} sec, {:.0f} queries/sec'.format(len(words), secs, len(words) / secs))
@@ -0,0 +1,66 @@
+import numpy as np
+
+
+def counts_by_id(counts, rev_vocab):
+    '''
+    Args:
+        counts: dict, word to count mapping
+        rev_vocab: dict, word id to word mapping
+    Returns:
+        id_counts: ndarray with shape (vocab size,), count of each word id
+    '''
+    return np.array([counts[rev_vocab[i]] for i in range(len(rev_vocab))], dtype=np.float64)
+
+
+def keep_probs(id_counts, threshold=1e-5):
+    '''
+    Probability of keeping each occurrence of a word when subsampling frequent words,
+    (sqrt(f / t) + 1) * t / f for word frequency f and threshold t as in word2vec.
+    Words with frequency below about t are always kept.
+    Returns:
+        probs: ndarray with shape (vocab size,)
+    '''
+    freqs = id_counts / id_counts.sum()
+    return np.minimum((np.sqrt(freqs / threshold) + 1) * threshold / freqs, 1.0)
+
+
+def build_alias_table(weights):
+    '''
+    Build a Walker alias table to draw ids in O(1) with probability proportional to weights.
+    Args:
+        weights: ndarray with shape (n,), non-negative
+    Returns:
+        probs: ndarray with shape (n,), probability of keeping the drawn slot
+        aliases: ndarray with shape (n,), id used when the slot is not kept
+    '''
+    n = len(weights)
+    scaled = weights * n / weights.sum()
+    probs = np.ones(n)
+    aliases = np.arange(n)
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        probs[s] = scaled[s]
+        aliases[s] = l
+        # the large slot gives away the rest of the small slot
+        scaled[l] -= 1.0 - scaled[s]
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    return probs, aliases
+
+
+def alias_draw(probs, aliases, size):
+    '''
+    Draw ids from an alias table built by build_alias_table.
+    Args:
+        size: int or tuple, output shape
+    Returns:
+        ids: ndarray of int32 with the given shape
+    '''
+    slots = np.random.randint(len(probs), size=size)
+    keep = np.random.random_sample(size) < probs[slots]
+    return np.where(keep, slots, aliases[slots]).astype(np.int32)
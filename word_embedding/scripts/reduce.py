@@ -1,4 +1,9 @@
 from argparse import ArgumentParser
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from embedding_io import load_embeddings
 
 parser = ArgumentParser()
 
@@ -70,9 +75,21 @@ words = {'American', 'Arafat', 'Brazil', 'CD', 'FBI', 'Freud', 'Harvard',
 'warning', 'water', 'wealth', 'weapon', 'weather', 'wine', 'withdrawal',
 'wizard', 'woman', 'wood', 'woodland', 'word', 'world', 'year', 'yen', 'zoo'}
 
-for row in open(args.emb_path):
+if args.emb_path.endswith(".npy"):
+
+    # binary embedding written by embedding_io.save_embeddings, rows are memory-mapped
+    embedding = load_embeddings(args.emb_path)
+
+    for word in embedding.words:
+
+        if word in words:
+            print(word, " ".join(map(str, embedding[word])), "")
+
+else:
+
+    for row in open(args.emb_path):
 
-    word, *_ = row.split()
+        word, *_ = row.split()
 
-    if word in words:
-        print(row, end = "")
+        if word in words:
+            print(row, end = "")
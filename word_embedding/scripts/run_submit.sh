@@ -1,3 +1,3 @@
 #!/bin/bash
-python3 similarity.py > prediction.csv --embedding ../embeddings.txt --words similarity/test_x.csv
+python3 similarity.py > prediction.csv --embedding ../embeddings.npy --words similarity/test_x.csv
 
@@ -1,12 +1,21 @@
 from argparse import ArgumentParser
+import os
 import sys
 
 import numpy as np
 import pandas as pd
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from embedding_io import load_embeddings
+
 
 def read_embedding(path):
 
+    if path.endswith(".npy"):
+        # memory-mapped binary embedding written by embedding_io.save_embeddings
+        embedding = load_embeddings(path)
+        return embedding, embedding.dim
+
     embedding = {}
     dim = None
 
@@ -1,7 +1,11 @@
+import os
 import sys
 from nltk.stem.wordnet import WordNetLemmatizer
 
-lemmatizer = WordNetLemmatizer()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from stem_cache import StemCache
+
+lemmatize = StemCache('wordnet', WordNetLemmatizer().lemmatize)
 
 filename = sys.argv[1]
 
@@ -9,12 +13,11 @@ with open(filename) as f:
     next(f)
     word_pairs = []
     for line in f:
-        lemm_words = [lemmatizer.lemmatize(word).lower() for word in line.strip().split(',')[1:]]
+        lemm_words = [lemmatize(word).lower() for word in line.strip().split(',')[1:]]
         word_pairs.append(lemm_words)
+lemmatize.save()
 
 with open('lemm_' + filename, 'w') as f:
     f.write('id,word1,word2\n')
     for i, word_pair in enumerate(word_pairs):
         f.write('{},{},{}\n'.format(i, word_pair[0], word_pair[1]))
-
-
@@ -0,0 +1,120 @@
+import numpy as np
+import embedding_io
+import sampling
+
+
+class SkipGram:
+    '''
+    Skip-gram input pipeline shared by the TensorFlow and the multi-process trainers.
+    Subclasses set batch_size, full_window_size, num_steps, num_sampled, dynamic_window
+    and rev_vocab, and call _init_sampling.
+    '''
+    def _init_sampling(self, counts, subsample, negative_sampling):
+        '''
+        Set up frequent-word subsampling and the unigram^0.75 alias table of negatives.
+        Args:
+            counts: dict, word to count mapping
+            subsample: float, subsampling threshold e.g. 1e-5, None to keep all words
+            negative_sampling: bool, whether batches carry negative samples
+        '''
+        if (subsample is not None or negative_sampling) and counts is None:
+            raise ValueError('Word counts are needed for subsampling and negative sampling.')
+        self.keep_probs = None
+        self.keep_fraction = 1.0 # expected fraction of the text kept by subsampling
+        self.alias_table = None
+        if counts is not None:
+            id_counts = sampling.counts_by_id(counts, self.rev_vocab)
+            if subsample is not None:
+                self.keep_probs = sampling.keep_probs(id_counts, subsample)
+                self.keep_fraction = float(np.sum(id_counts * self.keep_probs) / id_counts.sum())
+            if negative_sampling:
+                self.alias_table = sampling.build_alias_table(id_counts ** 0.75)
+
+    def _termination(self, data):
+        '''
+        Determine maximum step, i.e. where the windows used for num_steps batches end.
+        '''
+        self.idx_hop = int(self.batch_size / (self.full_window_size - 1))
+        if self.num_steps * self.idx_hop < len(data):
+            termination = self.num_steps * self.idx_hop
+            print('Run {} steps.'.format(int(self.num_steps)))
+        else:
+            termination = len(data)
+            print('Assigned number of steps exceeded data length. ' 
+                  'Use data length instead. Run ~{} steps.'.format(int(len(data) / self.idx_hop)))
+        return termination
+
+    def _extract_batch(self, data, termination, chunk_size=100000, worker=0, num_workers=1, skip=0):
+        '''
+        Extract batch for each step with assigned batch size.
+        (center, context) pairs are built chunk by chunk from a strided view of
+        all windows, in window order and from the leftmost context in each window.
+        With dynamic_window, each center word only keeps contexts within a random
+        distance 1..half window, and batches are filled from the remaining pairs.
+        With subsampling, frequent words are dropped from each chunk before its
+        windows are built, so windows reach further in the remaining text.
+        Args:
+            data: list or ndarray, the whole text data as word ids, may be a memmap
+            termination: int, stopping criterion
+            chunk_size: int, number of windows processed at a time
+            worker: int, only every num_workers-th chunk starting from chunk worker is used,
+                    so num_workers generators together cover the data once
+            num_workers: int, number of generators sharing the data
+            skip: int, number of leading batches dropped, to resume where a checkpoint stopped
+        Yields:
+            centers: ndarray with shape (batch size,), center word ids
+            contexts: ndarray with shape (batch size, 1), corresponding context word ids
+            negatives: ndarray with shape (batch size, num sampled), negative word ids,
+                       only yielded with 'negative_sampling'
+        '''
+        data = np.asarray(data) # windows are cast to int32 chunk by chunk, a memmap is never read whole
+        half_window = int(self.full_window_size / 2)
+        full_window = 2 * half_window + 1
+        columns = np.delete(np.arange(full_window), half_window) # context columns of a window
+        distances = np.abs(columns - half_window)
+
+        # centers half_window, ..., end - 1 are used, as many windows as the steps need
+        num_batches = max(0, -(-(int(termination) - 2 * half_window - self.idx_hop) // self.idx_hop))
+        end = half_window + num_batches * self.idx_hop
+        # windows[i] = data[i:i + full_window], i.e. the window centered at i + half_window
+        windows = np.lib.stride_tricks.as_strided(data, shape=(max(end - half_window, 0), full_window),
+                                                  strides=(data.strides[0],) * 2, writeable=False)
+
+        left_centers = np.zeros(0, dtype=np.int32)
+        left_contexts = np.zeros(0, dtype=np.int32)
+        batch_index = 0
+        for start in range(worker * chunk_size, len(windows), num_workers * chunk_size):
+            chunk = windows[start:start + chunk_size]
+            if self.keep_probs is not None:
+                segment = data[start:start + len(chunk) + 2 * half_window]
+                segment = segment[np.random.random_sample(len(segment)) < self.keep_probs[segment]]
+                chunk = np.lib.stride_tricks.as_strided(segment, shape=(max(len(segment) - 2 * half_window, 0), full_window),
+                                                        strides=(segment.strides[0],) * 2, writeable=False)
+            contexts = chunk[:, columns].astype(np.int32)
+            centers = np.repeat(chunk[:, half_window:half_window + 1].astype(np.int32), len(columns), axis=1)
+            if self.dynamic_window:
+                reduced = np.random.randint(1, half_window + 1, size=(len(chunk), 1))
+                keep = distances[np.newaxis, :] <= reduced
+                centers, contexts = centers[keep], contexts[keep]
+            centers = np.concatenate([left_centers, centers.ravel()])
+            contexts = np.concatenate([left_contexts, contexts.ravel()])
+            num_full = len(centers) - len(centers) % self.batch_size
+            for i in range(0, num_full, self.batch_size):
+                batch_index += 1
+                if batch_index <= skip:
+                    continue
+                batch = centers[i:i + self.batch_size], contexts[i:i + self.batch_size, np.newaxis]
+                if self.alias_table is not None:
+                    batch += (sampling.alias_draw(*self.alias_table, size=(self.batch_size, self.num_sampled)),)
+                yield batch
+            left_centers, left_contexts = centers[num_full:], contexts[num_full:]
+
+    def _write_embeddings(self, id_to_embedding, path='embeddings', text=True):
+        '''
+        Save embeddings as path.npy and path.vocab, which embedding_io.load_embeddings
+        memory-maps, and as the text file path.txt unless text is False.
+        '''
+        words = [self.rev_vocab[i] for i in range(len(id_to_embedding))]
+        embedding_io.save_embeddings(path, words, id_to_embedding)
+        if text:
+            embedding_io.write_text_embeddings(path + '.txt', words, id_to_embedding)
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import pickle
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+
+class StemCache:
+    def __init__(self, name, normalize, cache_dir=CACHE_DIR):
+        '''
+        Memoize a slow word normalizer (Porter stemming, WordNet lemmatization) in a
+        dict persisted to cache_dir/<name>.pkl, so a word is normalized once across runs.
+        Call save() to persist words added by calls.
+        Args:
+            name: str, name of the normalizer, one cache file per name
+            normalize: function, word to normalized word
+            cache_dir: str, directory of the cache files, word_embedding/cache by default
+        '''
+        self.name = name
+        self.normalize = normalize
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, name + '.pkl')
+        self.cache = None # read on first use
+        self.num_added = 0
+
+    def __call__(self, word):
+        if self.cache is None:
+            self.cache = self._read(self.path) or {}
+        normalized = self.cache.get(word)
+        if normalized is None:
+            normalized = self.normalize(word)
+            self.cache[word] = normalized
+            self.num_added += 1
+        return normalized
+
+    def stems(self, words):
+        '''
+        Return the normalized word to word mapping of a vocabulary, where later words
+        win as in Loader.load_data. The mapping is persisted keyed by a hash of the
+        vocabulary, so a repeat run on the same vocabulary reads it back directly.
+        Args:
+            words: iterable of str, the vocabulary in id order
+        Returns:
+            stems: dict, normalized word to word mapping
+        '''
+        words = list(words)
+        digest = hashlib.sha1('\n'.join(words).encode('utf-8')).hexdigest()[:16]
+        path = os.path.join(self.cache_dir, '{}_{}.pkl'.format(self.name, digest))
+        stems = self._read(path)
+        if stems is None:
+            stems = {self(word): word for word in words}
+            self._write(path, stems)
+            self.save()
+        return stems
+
+    def save(self):
+        '''
+        Write the memo to disk if words were added since it was read.
+        '''
+        if self.num_added:
+            self._write(self.path, self.cache)
+            self.num_added = 0
+
+    @staticmethod
+    def _read(path):
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def _write(self, path, obj):
+        # write then rename, so an interrupted run never leaves a truncated cache
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
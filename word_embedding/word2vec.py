@@ -1,18 +1,28 @@
 #!/usr/bin/env python3
 import tensorflow as tf
 import numpy as np
+import os
 import random
 import time
-from nltk.stem.porter import PorterStemmer
+from argparse import ArgumentParser
 from scipy import stats
-from loader import Loader
+from loader import Loader, stemmer
+from prefetch import Prefetcher
+from skipgram import SkipGram
+from embedding_io import Embeddings
+from query import QueryEngine
 
-stemmer = PorterStemmer()
 
-
-class Word2Vec:
+class Word2Vec(SkipGram):
     def __init__(self, vocab, rev_vocab, batch_size=128, embed_size=100, 
-                 num_sampled=64, full_window_size=3, num_steps=None):
+                 num_sampled=64, full_window_size=3, num_steps=None, dynamic_window=False,
+                 counts=None, subsample=None, loss='sampled_softmax'):
+        '''
+        Args:
+            counts: dict, word to count mapping, required by subsample and 'negative_sampling'
+            subsample: float, threshold of frequent-word subsampling e.g. 1e-5, None to keep all words
+            loss: str, 'sampled_softmax' or 'negative_sampling' (negatives drawn from unigram^0.75)
+        '''
         self.vocab = vocab
         self.rev_vocab = rev_vocab
         self.batch_size = batch_size
@@ -20,12 +30,18 @@ class Word2Vec:
         self.embed_size = embed_size
         self.num_sampled = num_sampled
         self.full_window_size = full_window_size
+        self.dynamic_window = dynamic_window # sample a smaller window for each center word
         self.num_steps = num_steps
         if num_steps is None:
             raise ValueError('Number of steps should be specified.')
+        self._init_sampling(counts, subsample, loss == 'negative_sampling')
                 
         self.train_x = tf.placeholder(tf.int32, shape=[self.batch_size], name='train_x')
         self.train_y = tf.placeholder(tf.int32, shape=[self.batch_size, 1], name='train_y')
+        self.inputs = [self.train_x, self.train_y]
+        if loss == 'negative_sampling':
+            self.train_neg = tf.placeholder(tf.int32, shape=[self.batch_size, self.num_sampled], name='train_neg')
+            self.inputs.append(self.train_neg)
         self.sess = tf.Session()
 
         with tf.name_scope('embedding'), tf.device('/cpu:0'):
@@ -38,18 +54,57 @@ class Word2Vec:
                                                      name='W')
             self.b = tf.Variable(tf.zeros([self.vocab_size]), 'b')
 
-            # different losses: sampled_softmax_loss, nce_loss
-            self.loss = tf.reduce_mean(tf.nn.sampled_softmax_loss(weights=self.W, 
-                                                                  biases=self.b, 
-                                                                  inputs=self.embedded_x,
-                                                                  labels=self.train_y,
-                                                                  num_sampled=self.num_sampled, 
-                                                                  num_classes=self.vocab_size,
-                                                                  name='loss'))
+            # different losses: sampled_softmax_loss, nce_loss, negative sampling
+            if loss == 'sampled_softmax':
+                self.loss = tf.reduce_mean(tf.nn.sampled_softmax_loss(weights=self.W, 
+                                                                      biases=self.b, 
+                                                                      inputs=self.embedded_x,
+                                                                      labels=self.train_y,
+                                                                      num_sampled=self.num_sampled, 
+                                                                      num_classes=self.vocab_size,
+                                                                      name='loss'))
+            elif loss == 'negative_sampling':
+                self.loss = self._negative_sampling_loss()
+            else:
+                raise NotImplementedError('Loss not implemented.')
+
+    def _negative_sampling_loss(self):
+        '''
+        -log sigmoid(u_o . v_c) - sum_k log sigmoid(-u_k . v_c), where the negatives
+        u_k of each pair are fed through train_neg.
+        '''
+        true_y = tf.squeeze(self.train_y, axis=1)
+        true_logits = (tf.reduce_sum(self.embedded_x * tf.nn.embedding_lookup(self.W, true_y), 1)
+                       + tf.gather(self.b, true_y))
+        neg_logits = (tf.reduce_sum(tf.expand_dims(self.embedded_x, 1) * tf.nn.embedding_lookup(self.W, self.train_neg), 2)
+                      + tf.gather(self.b, self.train_neg))
+        true_loss = tf.nn.sigmoid_cross_entropy_with_logits(labels=tf.ones_like(true_logits), logits=true_logits)
+        neg_loss = tf.nn.sigmoid_cross_entropy_with_logits(labels=tf.zeros_like(neg_logits), logits=neg_logits)
+        return tf.reduce_mean(true_loss + tf.reduce_sum(neg_loss, 1), name='loss')
 
-    def train(self, data):
+    def train(self, data, prefetch_workers=1, queue_size=100, checkpoint_dir=None, checkpoint_every=10000,
+              dev_id_pairs=None, dev_labels=None, eval_every=10000, patience=None):
         '''
         Set up optimizer and start training.
+        Batches are prepared by background threads into a bounded queue while
+        the graph runs. With more than one worker, batches of different parts
+        of the data are interleaved.
+        With checkpoint_dir, the variables (embeddings, output weights, Adagrad
+        accumulators) and the number of batches consumed from each worker are saved
+        every checkpoint_every steps, and training resumes from the latest checkpoint
+        there, skipping the batches already trained on.
+        Args:
+            data: ndarray, the whole text data as word ids
+            prefetch_workers: int, number of threads preparing batches, must match when resuming
+            queue_size: int, maximum number of batches prepared ahead
+            checkpoint_dir: str, directory of checkpoints, None to disable checkpointing
+            checkpoint_every: int, steps between checkpoints
+            dev_id_pairs: ndarray with shape (#pairs, 2), word id pairs from word_id_pairs,
+                          None to disable evaluation during training
+            dev_labels: list, dev set similarity labels
+            eval_every: int, steps between dev Spearman correlations
+            patience: int, stop after this many evaluations without a better correlation,
+                      None to always run num_steps
         '''
         # set optimizer
         optimizer = tf.train.AdagradOptimizer(1.0)
@@ -58,73 +113,89 @@ class Word2Vec:
         # normalize embeddings
         norm = tf.sqrt(tf.reduce_sum(tf.square(self.embeddings), 1, keep_dims=True))
         self.norm_embeddings = self.embeddings / norm
-        
-        # determine maximum step 
-        self.idx_hop = int(self.batch_size / (self.full_window_size - 1))
-        if self.num_steps * self.idx_hop < len(data):
-            termination = self.num_steps * self.idx_hop
-            print('Run {} steps.'.format(int(self.num_steps)))
-        else:
-            termination = len(data)
-            print('Assigned number of steps exceeded data length. ' 
-                  'Use data length instead. Run ~{} steps.'.format(int(len(data) / self.idx_hop)))
-        batch_pairs = self._extract_batch(data, termination)
+
+        # number of batches consumed from each prefetch worker, i.e. the input stream position
+        position = tf.Variable(tf.zeros([prefetch_workers], dtype=tf.int64), trainable=False, name='input_position')
+        new_position = tf.placeholder(tf.int64, shape=[prefetch_workers])
+        assign_position = position.assign(new_position)
+        saver = tf.train.Saver(max_to_keep=2)
 
         self.sess.run(tf.global_variables_initializer())
-        step = 0
+        consumed = np.zeros(prefetch_workers, dtype=np.int64)
+        checkpoint = None
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+            checkpoint = tf.train.latest_checkpoint(checkpoint_dir)
+        if checkpoint:
+            saved_shape = tf.train.NewCheckpointReader(checkpoint).get_variable_to_shape_map()['input_position']
+            if saved_shape != [prefetch_workers]:
+                raise ValueError('Checkpoint {} was written with {} prefetch workers, not {}.'.format(
+                    checkpoint, saved_shape[0], prefetch_workers))
+            saver.restore(self.sess, checkpoint)
+            consumed = self.sess.run(position)
+            print('Resumed from {} at step {}.'.format(checkpoint, consumed.sum()))
+
+        termination = self._termination(data)
+        batch_pairs = Prefetcher([self._tag_batches(i, self._extract_batch(data, termination, worker=i,
+                                                                           num_workers=prefetch_workers,
+                                                                           skip=consumed[i]))
+                                  for i in range(prefetch_workers)], capacity=queue_size)
+
+        step = int(consumed.sum())
         avg_loss = 0
-        for batch_x, batch_y in batch_pairs:
-            _, loss_ = self.sess.run([train_op, self.loss], 
-                                     feed_dict={self.train_x: batch_x, self.train_y: batch_y})
+        occupancy = 0
+        best_corr = -np.inf
+        num_worse = 0
+        log_time = time.time()
+        for worker, batch in batch_pairs:
+            occupancy += batch_pairs.occupancy()
+            _, loss_ = self.sess.run([train_op, self.loss], feed_dict=dict(zip(self.inputs, batch)))
+            consumed[worker] += 1
             step += 1
             avg_loss += loss_
             if step % 2000 == 0:
-                print('Step {}, Average Loss: {:.6f}'.format(step, avg_loss / 1000))
+                print('Step {}, Average Loss: {:.6f}, {:.1f} steps/sec, queue {:.1f}/{}'.format(
+                    step, avg_loss / 1000, 2000 / (time.time() - log_time), occupancy / 2000, queue_size))
                 avg_loss = 0
+                occupancy = 0
+                log_time = time.time()
+            if checkpoint_dir and step % checkpoint_every == 0:
+                self.sess.run(assign_position, feed_dict={new_position: consumed})
+                saver.save(self.sess, os.path.join(checkpoint_dir, 'model'), global_step=step)
+            if dev_id_pairs is not None and step % eval_every == 0:
+                corr = self._correlation(dev_id_pairs, dev_labels)
+                print('Step {}, Dev Correlation: {:.4f}'.format(step, corr))
+                if corr > best_corr:
+                    best_corr = corr
+                    num_worse = 0
+                else:
+                    num_worse += 1
+                    if patience is not None and num_worse >= patience:
+                        print('No better correlation in {} evaluations, stop at step {}.'.format(num_worse, step))
+                        break
+        if checkpoint_dir:
+            self.sess.run(assign_position, feed_dict={new_position: consumed})
+            saver.save(self.sess, os.path.join(checkpoint_dir, 'model'), global_step=step)
 
-    def _extract_batch(self, data, termination):
+    @staticmethod
+    def _tag_batches(worker, batches):
         '''
-        Extract batch for each step with assigned batch size.
-        Args:
-            data: list, the whole text data.
-            termination: int, stopping criterion
-        Yields:
-            centers: ndarray with shape (batch size,), center word ids
-            contexts: ndarray with shape (batch size, 1), corresponding context word ids
-        '''
-        half_window = int(self.full_window_size / 2)
-        context_len = 2 * half_window
-
-        idx = half_window
-        while idx + half_window + self.idx_hop < termination:
-            centers = np.zeros((self.batch_size,), dtype=np.int32)
-            contexts = np.zeros((self.batch_size, 1), dtype=np.int32)
-            for window_idx in range(self.idx_hop):
-                for i in range(self.full_window_size):
-                    if i == half_window:
-                        continue
-                    elif i < half_window:
-                        centers[i + window_idx * context_len] = data[window_idx + idx]
-                        contexts[i + window_idx * context_len, 0] = data[i - half_window + window_idx + idx]
-                    elif i > half_window:
-                        centers[i - 1 + window_idx * context_len] = data[window_idx + idx]
-                        contexts[i - 1 + window_idx * context_len, 0] = data[i - half_window + window_idx + idx]
-                    else:
-                        raise ValueError('Should not happen.')
-            idx += self.idx_hop
-            yield centers, contexts
+        Yield (worker, batch) so the training loop can count batches of each worker.
+        '''
+        for batch in batches:
+            yield worker, batch
 
-    def evaluate(self, counts, stems, word_pairs, simu_labels=None, filename=None):
+    def word_id_pairs(self, counts, stems, word_pairs):
         '''
-        Evaluate on dev set or generate correlations on test set for submission.
+        Map word pairs to word id pairs. A word not in the vocabulary is looked up
+        by its stem, and replaced by a random uncommon word if that fails too.
+        Compute once and pass to train/evaluate to avoid repeating the lookups.
         Args:
             counts: dict, word to count mapping
             stems: dict, stemmed word to original word mapping
-            word_pairs: list of list, word pairs to evaluate on
-            simu_labels: list, dev set correlation labels
-            filename: str, file name for submission
+            word_pairs: list of list, word pairs
         Returns:
-            None
+            word_id_pairs: ndarray with shape (#pairs, 2)
         '''
         word_id_pairs = []
         uncommon_words = [word for word in counts.keys() if counts[word] == 1] # sample uncommon words
@@ -135,7 +206,7 @@ class Word2Vec:
                     # if the word is found, use it to lookup
                     id_ = self.vocab[w]
                 else:
-                    stemmed_word = stemmer.stem(w)
+                    stemmed_word = stemmer(w)
                     if stemmed_word in stems:
                         # if the word is not found, find its stemmed form
                         id_ = self.vocab[stems[stemmed_word]]
@@ -146,47 +217,73 @@ class Word2Vec:
                         print('{}: Word "{}" is NOT found'.format(i, w))
                 id_pair.append(id_)
             word_id_pairs.append(id_pair)
+        stemmer.save()
+        return np.array(word_id_pairs)
+
+    def _similarities(self, word_id_pairs):
+        # look up for words in the normalized table, no new ops are added to the graph
+        id_to_embedding = self.sess.run(self.norm_embeddings)
+        return np.sum(id_to_embedding[word_id_pairs[:, 0]] * id_to_embedding[word_id_pairs[:, 1]], axis=1)
 
-        # look up for words
-        word_id_flat = np.array(word_id_pairs).flatten()
-        words = tf.placeholder(tf.int32, shape=[len(word_id_flat)], name='words')
-        embedded_words = tf.nn.embedding_lookup(self.norm_embeddings, words, name='embedded_words')
-        wordvecs = self.sess.run(embedded_words, feed_dict={words: word_id_flat})
-        simu_predicts = np.sum(wordvecs[::2] * wordvecs[1::2], axis=1)
+    def _correlation(self, word_id_pairs, simu_labels):
+        return stats.spearmanr(self._similarities(word_id_pairs), simu_labels).correlation
 
+    def evaluate(self, counts, stems, word_pairs, simu_labels=None, filename=None):
+        '''
+        Evaluate on dev set or generate correlations on test set for submission.
+        Args:
+            counts: dict, word to count mapping
+            stems: dict, stemmed word to original word mapping
+            word_pairs: list of list, word pairs to evaluate on
+            simu_labels: list, dev set correlation labels
+            filename: str, file name for submission
+        Returns:
+            None
+        '''
+        word_id_pairs = self.word_id_pairs(counts, stems, word_pairs)
         if simu_labels:
             # evaluate on dev set
-            corr = stats.spearmanr(simu_predicts, simu_labels).correlation
+            corr = self._correlation(word_id_pairs, simu_labels)
             print('Correlation:', corr)
         else:
             # generate submission file
+            simu_predicts = self._similarities(word_id_pairs)
             with open('./submissions/' + filename + '.csv', 'w') as f:
                 f.write('id,similarity\n')
                 for i, similarity in enumerate(simu_predicts):
                     f.write('{},{}\n'.format(i, similarity))
 
-    def export_embeddings(self):
+    def query_engine(self):
         '''
-        Export the whole embedding table to a file.
+        Return a query.QueryEngine over the current normalized embeddings.
         '''
-        ids = list(range(self.vocab_size))
-        all_ids = tf.placeholder(tf.int32, shape=[self.vocab_size], name='all_ids')
-        embedded_words = tf.nn.embedding_lookup(self.norm_embeddings, all_ids, name='embedded_words')
-        id_to_embedding = self.sess.run(embedded_words, feed_dict={all_ids: ids}) # shape=(vocab_size, embed_size)
-        print('Final embedding shape: ', id_to_embedding.shape)
+        id_to_embedding = self.sess.run(self.norm_embeddings)
+        return QueryEngine(Embeddings([self.rev_vocab[i] for i in range(self.vocab_size)], id_to_embedding))
 
-        with open('embeddings.txt', 'w') as f:
-            for i, embed_vec in enumerate(id_to_embedding):
-                vec_str = ''
-                for num in embed_vec:
-                    vec_str += str(num) + ' '
-                f.write('{} {}\n'.format(self.rev_vocab[ids[i]], vec_str)) 
+    def export_embeddings(self, path='embeddings', text=True):
+        '''
+        Export the whole embedding table to path.npy and path.vocab, plus path.txt if text.
+        '''
+        id_to_embedding = self.sess.run(self.norm_embeddings) # shape=(vocab_size, embed_size)
+        print('Final embedding shape: ', id_to_embedding.shape)
+        self._write_embeddings(id_to_embedding, path, text)
 
 
 if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-c', '--checkpoint_dir', dest='checkpoint_dir',
+                        help='save checkpoints here and resume from the latest one')
+    parser.add_argument('-e', '--eval_every', dest='eval_every', type=int, default=10000,
+                        help='steps between dev correlations during training')
+    parser.add_argument('-p', '--patience', dest='patience', type=int,
+                        help='stop after this many dev correlations without improvement')
+    args = parser.parse_args()
+
     start = time.time()
     loader = Loader()
-    data, vocab, rev_vocab, counts, stems = loader.load_data('data3m')
+    if not loader.has_preprocessed('data3m'):
+        loader.preprocess('data3m')
+    data, vocab, rev_vocab, counts, stems = loader.load_mmap('data3m')
     dev_word_pairs, simu_labels = loader.load_eval()
     test_word_pairs = loader.load_test()
     print('Done loading data.')
@@ -194,7 +291,9 @@ if __name__ == '__main__':
     print('Vocabulary size:', len(vocab))
 
     w2v = Word2Vec(vocab, rev_vocab, embed_size=50, full_window_size=3, num_steps=5e+5)
-    w2v.train(data)
+    dev_id_pairs = w2v.word_id_pairs(counts, stems, dev_word_pairs)
+    w2v.train(data, checkpoint_dir=args.checkpoint_dir, dev_id_pairs=dev_id_pairs, dev_labels=simu_labels,
+              eval_every=args.eval_every, patience=args.patience)
     w2v.evaluate(counts, stems, dev_word_pairs, simu_labels=simu_labels)
     w2v.evaluate(counts, stems, test_word_pairs, filename='submission.csv')
 